@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient  # type: ignore
+except ImportError:
+    AsyncIOMotorClient = None  # type: ignore
+
+try:
+    from aiobotocore.config import AioConfig  # type: ignore
+    from aiobotocore.session import get_session  # type: ignore
+except ImportError:
+    get_session = None  # type: ignore
+
+from .config import get_settings
+from .db_utils import (
+    JOBS_COLLECTION,
+    PROCESSED_COLLECTION,
+    STATUS_PROJECTION,
+    get_job,
+    get_statuses,
+    job_projection,
+    status_query,
+    statuses_from,
+)
+from .metrics import stage_timer
+from .s3_utils import cached_listing, list_videos_for_employee_date, listing_prefix, videos_from_pages
+
+logger = logging.getLogger("video-analysis.aio")
+
+# Async versions of the reads behind the HTTP endpoints, so a request waiting on Mongo or S3
+# does not hold a threadpool thread. They use motor and aiobotocore when installed; otherwise
+# the blocking clients run on a dedicated thread limiter that long-running calls never use.
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+_motor = None
+_s3 = None
+_s3_stack: Optional[AsyncExitStack] = None
+_s3_lock: Optional[asyncio.Lock] = None
+
+
+def _blocking_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(max(1, get_settings().async_io_threads))
+    return _limiter
+
+
+async def run_blocking(fn, *args, **kwargs):
+    # For short blocking calls only; long work goes through starlette's run_in_threadpool.
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs), limiter=_blocking_limiter())
+
+
+def _use_motor() -> bool:
+    return AsyncIOMotorClient is not None and get_settings().async_clients_enabled
+
+
+def _use_aiobotocore() -> bool:
+    return get_session is not None and get_settings().async_clients_enabled
+
+
+def _motor_db():
+    global _motor
+    s = get_settings()
+    if _motor is None:
+        _motor = AsyncIOMotorClient(
+            s.mongodb_uri,
+            serverSelectionTimeoutMS=s.mongo_server_selection_timeout_ms,
+            connectTimeoutMS=s.mongo_connect_timeout_ms,
+            socketTimeoutMS=s.mongo_socket_timeout_ms,
+        )
+    return _motor[s.mongodb_db]
+
+
+async def _s3_client():
+    global _s3, _s3_stack, _s3_lock
+    if _s3_lock is None:
+        _s3_lock = asyncio.Lock()
+    async with _s3_lock:
+        if _s3 is None:
+            s = get_settings()
+            cfg = AioConfig(
+                region_name=s.aws_region,
+                connect_timeout=s.s3_connect_timeout,
+                read_timeout=s.s3_read_timeout,
+                retries={"max_attempts": 3, "mode": "standard"},
+                s3={"addressing_style": "path"} if s.s3_endpoint_url else None,
+            )
+            stack = AsyncExitStack()
+            _s3 = await stack.enter_async_context(
+                get_session().create_client("s3", config=cfg, endpoint_url=s.s3_endpoint_url or None)
+            )
+            _s3_stack = stack
+    return _s3
+
+
+async def close_clients() -> None:
+    global _motor, _s3, _s3_stack
+    if _s3_stack is not None:
+        await _s3_stack.aclose()
+        _s3, _s3_stack = None, None
+    if _motor is not None:
+        _motor.close()
+        _motor = None
+
+
+async def list_videos(employee_id: str, date_str: str) -> List[Dict]:
+    if not _use_aiobotocore():
+        return await run_blocking(list_videos_for_employee_date, employee_id, date_str)
+    cached = cached_listing(employee_id, date_str)
+    if cached is not None:
+        return cached
+    s = get_settings()
+    client = await _s3_client()
+    prefix = listing_prefix(employee_id, date_str)
+    logger.info(f"Listing S3 bucket={s.s3_bucket} prefix={prefix} date={date_str}")
+    paginator = client.get_paginator("list_objects_v2")
+    with stage_timer("s3_list"):
+        pages = [page async for page in paginator.paginate(Bucket=s.s3_bucket, Prefix=prefix)]
+    return videos_from_pages(employee_id, date_str, pages)
+
+
+async def statuses(listings: Dict[Tuple[str, str], List[str]]) -> List[Dict]:
+    if not listings:
+        return []
+    if not _use_motor():
+        return await run_blocking(get_statuses, listings)
+    with stage_timer("mongo_read"):
+        cursor = _motor_db()[PROCESSED_COLLECTION].find(status_query(listings), STATUS_PROJECTION)
+        markers = await cursor.to_list(length=None)
+    return statuses_from(listings, markers)
+
+
+async def status_listings(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[str]]:
+    # S3 listings for many pairs, STATUS_LIST_CONCURRENCY at a time.
+    limit = asyncio.Semaphore(max(1, get_settings().status_list_concurrency))
+
+    async def one(pair: Tuple[str, str]) -> List[str]:
+        async with limit:
+            return [v["file_name"] for v in await list_videos(*pair)]
+
+    names = await asyncio.gather(*(one(pair) for pair in pairs))
+    return dict(zip(pairs, names))
+
+
+async def job(job_id: str, events_from: int = 0) -> Optional[Dict]:
+    if not _use_motor():
+        return await run_blocking(get_job, job_id, events_from)
+    return await _motor_db()[JOBS_COLLECTION].find_one({"_id": job_id}, job_projection(events_from))
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .config import get_settings
+from .db_utils import artifacts_col
+from .gpt_processor import FRAME_BATCH_PROMPT_VERSION, FRAME_PROMPT_VERSION, event_prompt_version
+
+logger = logging.getLogger("video-analysis.artifacts")
+
+# Bump a stage's version when its code changes in a way that invalidates stored results.
+PROBE_VERSION = "1"
+FRAMES_VERSION = "1"
+TRANSCRIPT_VERSION = "1"
+EVENTS_VERSION = "1"
+
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def stage_versions() -> Dict[str, str]:
+    # Each stage's version covers the settings that shape its output and chains the version of
+    # the stage it reads from, so a change invalidates that stage and everything after it.
+    s = get_settings()
+    frames = _fingerprint(
+        FRAMES_VERSION,
+        s.s3_stream_frames,
+        s.frame_sampling,
+        s.frame_interval_sec,
+        s.frame_keyframes_only,
+        s.frame_scene_threshold,
+        s.frame_min_interval_sec,
+        s.frame_max_interval_sec,
+        s.frame_budget,
+        s.frame_preprocess_enabled,
+        s.frame_max_width,
+        s.frame_max_height,
+        s.frame_jpeg_quality,
+        s.frame_crop_top_px,
+        s.frame_crop_bottom_px,
+        s.frame_dedup_max_distance,
+    )
+    transcript = _fingerprint(
+        TRANSCRIPT_VERSION,
+        frames,
+        s.openai_model,
+        FRAME_PROMPT_VERSION,
+        FRAME_BATCH_PROMPT_VERSION if s.vision_batch_size > 1 else "",
+        s.vision_detail,
+    )
+    events = _fingerprint(
+        EVENTS_VERSION,
+        transcript,
+        s.openai_model,
+        event_prompt_version(),
+        s.event_window_sec,
+        s.event_window_overlap_sec,
+    )
+    # Per-window results of windowed synthesis share the events version.
+    return {"probe": PROBE_VERSION, "frames": frames, "transcript": transcript, "windows": events, "events": events}
+
+
+class VideoArtifacts:
+    # Stage results for one version of one recording: S3 key plus ETag, so an overwritten
+    # object never matches the old results. Reads come from the document loaded up front and
+    # every save is mirrored into it. Write failures are logged, never raised.
+
+    def __init__(self, key: str, etag: str, doc: Optional[Dict], versions: Dict[str, str]):
+        self.key = key
+        self.etag = etag
+        self.versions = versions
+        self._id = f"{key}@{etag}"
+        self._doc = doc or {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> Optional[Dict]:
+        entry = self._doc.get(name)
+        if isinstance(entry, dict) and entry.get("version") == self.versions[name]:
+            return entry
+        return None
+
+    def _save(self, fields: Dict) -> None:
+        try:
+            artifacts_col().update_one(
+                {"_id": self._id},
+                {"$set": dict(fields, key=self.key, etag=self.etag, updatedAt=datetime.utcnow())},
+                upsert=True,
+            )
+        except Exception as ex:
+            logger.warning(f"Could not save artifacts {sorted(fields)} for {self.key}: {ex}")
+
+    def duration(self) -> Optional[float]:
+        entry = self._stage("probe")
+        return entry.get("durationSec") if entry else None
+
+    def save_duration(self, duration_sec: float) -> None:
+        entry = {"version": self.versions["probe"], "durationSec": duration_sec}
+        with self._lock:
+            self._doc["probe"] = entry
+        self._save({"probe": entry})
+
+    def frames(self) -> Optional[Tuple[List[int], Dict[int, int]]]:
+        # (timestamps, reuse) where reuse maps near-duplicate frames to the frame they borrow from.
+        entry = self._stage("frames")
+        if entry is None:
+            return None
+        reuse = {int(ts): rep for ts, rep in entry.get("reuse", {}).items()}
+        return list(entry.get("timestamps", [])), reuse
+
+    def save_frames(self, timestamps: List[int], hashes: Dict[int, int], reuse: Dict[int, int]) -> None:
+        entry = {
+            "version": self.versions["frames"],
+            "timestamps": list(timestamps),
+            # dHashes are unsigned 64-bit, which BSON integers cannot hold.
+            "hashes": {str(ts): f"{h:016x}" for ts, h in hashes.items()},
+            "reuse": {str(ts): rep for ts, rep in reuse.items()},
+        }
+        with self._lock:
+            self._doc["frames"] = entry
+        self._save({"frames": entry})
+
+    def descriptions(self) -> Dict[int, str]:
+        entry = self._stage("transcript")
+        if entry is None:
+            return {}
+        return {int(ts): desc for ts, desc in entry.get("descriptions", {}).items()}
+
+    def save_descriptions(self, described: Dict[int, str]) -> None:
+        # Called from the vision workers after every chunk, so an interrupted video resumes
+        # from the last described frame. A stale transcript is replaced on the first write.
+        with self._lock:
+            entry = self._stage("transcript")
+            fresh = entry is None
+            if fresh:
+                entry = {"version": self.versions["transcript"], "descriptions": {}}
+                self._doc["transcript"] = entry
+            entry["descriptions"].update((str(ts), desc) for ts, desc in described.items())
+            if fresh:
+                self._save({"transcript": entry})
+                return
+        self._save({f"transcript.descriptions.{ts}": desc for ts, desc in described.items()})
+
+    def transcript(self) -> Optional[List[Tuple[int, str]]]:
+        # The full (timestamp, description) list, or None while any frame is undescribed.
+        frames = self.frames()
+        if frames is None or self._stage("transcript") is None:
+            return None
+        timestamps, reuse = frames
+        described = self.descriptions()
+        lines = []
+        for ts in timestamps:
+            desc = described.get(reuse.get(ts, ts))
+            if desc is None:
+                return None
+            lines.append((ts, desc))
+        return lines
+
+    def events(self, fullname: str, team: str) -> Optional[List[Dict]]:
+        entry = self._stage("events")
+        if entry is None or entry.get("fullName") != fullname or entry.get("team") != team:
+            return None
+        return entry.get("events")
+
+    def window_events(self, fullname: str, team: str) -> Dict[str, List[Dict]]:
+        # Complete windows of a windowed synthesis, keyed by gpt_processor.window_key.
+        entry = self._stage("windows")
+        if entry is None or entry.get("fullName") != fullname or entry.get("team") != team:
+            return {}
+        return dict(entry.get("results", {}))
+
+    def save_window_events(self, key: str, events: List[Dict], fullname: str, team: str) -> None:
+        # Called as each window finishes, so a video whose other windows failed reruns only those.
+        with self._lock:
+            entry = self._stage("windows")
+            fresh = entry is None or entry.get("fullName") != fullname or entry.get("team") != team
+            if fresh:
+                entry = {"version": self.versions["windows"], "fullName": fullname, "team": team, "results": {}}
+                self._doc["windows"] = entry
+            entry["results"][key] = events
+            if fresh:
+                self._save({"windows": entry})
+                return
+        self._save({f"windows.results.{key}": events})
+
+    def save_events(self, events: List[Dict], fullname: str, team: str) -> None:
+        entry = {"version": self.versions["events"], "fullName": fullname, "team": team, "events": events}
+        with self._lock:
+            self._doc["events"] = entry
+        self._save({"events": entry})
+
+
+def load_artifacts(video: Dict) -> Optional[VideoArtifacts]:
+    # None when artifacts are disabled or the listing has no ETag to key them by.
+    if not get_settings().artifacts_enabled or not video.get("etag"):
+        return None
+    key = video["key"]
+    etag = video["etag"]
+    try:
+        doc = artifacts_col().find_one({"_id": f"{key}@{etag}"})
+    except Exception as ex:
+        logger.warning(f"Could not load artifacts for {key}: {ex}")
+        doc = None
+    return VideoArtifacts(key, etag, doc, stage_versions())
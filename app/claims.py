@@ -0,0 +1,139 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .config import get_settings
+from .db_utils import claims_col
+
+logger = logging.getLogger("video-analysis.claims")
+
+
+def claim_id(employee_id: str, file_name: str) -> str:
+    return f"{employee_id}:{file_name}"
+
+
+class LeaseKeeper:
+    # Claims videos of one employee for one run, so replicas (or overlapping /process calls)
+    # never analyze the same file at once. A claim is a lease in the `claims` collection:
+    # the holder renews it from a heartbeat thread, and once it lapses (the holder died or
+    # stalled) any other worker may take it over. Results are only saved after confirm()
+    # shows the lease is still ours, which also extends it past the write.
+
+    def __init__(self, employee_id: str, lease_sec: int, heartbeat_sec: int):
+        self.employee_id = employee_id
+        self.lease_sec = max(10, lease_sec)
+        self.heartbeat_sec = max(1, min(heartbeat_sec, self.lease_sec // 3))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _lease_until(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_sec)
+
+    def claim(self, file_name: str) -> bool:
+        cid = claim_id(self.employee_id, file_name)
+        now = datetime.utcnow()
+        try:
+            previous = claims_col().find_one_and_update(
+                {"_id": cid, "$or": [{"leaseUntil": {"$lt": now}}, {"owner": self.owner}]},
+                {
+                    "$set": {
+                        "employeeID": self.employee_id,
+                        "fileName": file_name,
+                        "owner": self.owner,
+                        "leaseUntil": self._lease_until(),
+                        "heartbeatAt": now,
+                    },
+                    "$setOnInsert": {"claimedAt": now},
+                    "$inc": {"attempts": 1},
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # The claim exists with a live lease held by someone else.
+            return False
+        if previous is not None and previous.get("owner") not in (None, self.owner):
+            logger.warning(f"Took over expired claim on {file_name} from {previous['owner']}")
+        with self._lock:
+            self._held.add(file_name)
+        self._ensure_heartbeat()
+        return True
+
+    def confirm(self, file_names: Iterable[str]) -> Set[str]:
+        # Renews the given claims and returns the file names whose lease is still ours.
+        names = list(file_names)
+        if not names:
+            return set()
+        ids = [claim_id(self.employee_id, n) for n in names]
+        col = claims_col()
+        col.update_many(
+            {"_id": {"$in": ids}, "owner": self.owner},
+            {"$set": {"leaseUntil": self._lease_until(), "heartbeatAt": datetime.utcnow()}},
+        )
+        owned = set(d["fileName"] for d in col.find({"_id": {"$in": ids}, "owner": self.owner}, {"fileName": 1}))
+        lost = set(names) - owned
+        if lost:
+            logger.warning(f"Lost claims on {sorted(lost)}; another worker took them over")
+            with self._lock:
+                self._held.difference_update(lost)
+        return owned
+
+    def release(self, file_names: Iterable[str]) -> None:
+        names = list(file_names)
+        if not names:
+            return
+        ids = [claim_id(self.employee_id, n) for n in names]
+        with self._lock:
+            self._held.difference_update(names)
+        try:
+            claims_col().delete_many({"_id": {"$in": ids}, "owner": self.owner})
+        except Exception as ex:
+            logger.warning(f"Could not release {len(ids)} claims (they expire on their own): {ex}")
+
+    def _ensure_heartbeat(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._heartbeat, name=f"claims-{self.employee_id}", daemon=True
+            )
+            self._thread.start()
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.heartbeat_sec):
+            with self._lock:
+                ids = [claim_id(self.employee_id, n) for n in self._held]
+            if not ids:
+                continue
+            try:
+                claims_col().update_many(
+                    {"_id": {"$in": ids}, "owner": self.owner},
+                    {"$set": {"leaseUntil": self._lease_until(), "heartbeatAt": datetime.utcnow()}},
+                )
+            except Exception as ex:
+                logger.warning(f"Claim heartbeat failed for {len(ids)} claims: {ex}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            names = list(self._held)
+        self.release(names)
+
+
+def lease_keeper(employee_id: str) -> Optional[LeaseKeeper]:
+    s = get_settings()
+    if not s.claims_enabled:
+        return None
+    return LeaseKeeper(employee_id, s.claim_lease_sec, s.claim_heartbeat_sec)
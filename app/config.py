@@ -1,4 +1,5 @@
 import os
+import tempfile
 from functools import lru_cache
 from typing import Optional
 from dotenv import load_dotenv
@@ -19,20 +20,133 @@ class Settings:
         "S3_PREFIX",
         "c0e02a19-d4b3-42c7-909a-576b7bc0d4a1/activitytrackercontainer",
     )
+    # Point at an S3-compatible endpoint (MinIO, a local stand-in) instead of AWS.
+    s3_endpoint_url: str = os.getenv("S3_ENDPOINT_URL", "")
     s3_connect_timeout: int = int(os.getenv("S3_CONNECT_TIMEOUT", "5"))
     s3_read_timeout: int = int(os.getenv("S3_READ_TIMEOUT", "60"))
+    s3_list_by_date_prefix: bool = _as_bool(os.getenv("S3_LIST_BY_DATE_PREFIX", "true"), True)
+    s3_list_cache_ttl_sec: int = int(os.getenv("S3_LIST_CACHE_TTL_SEC", "60"))
+    # S3 listings fetched at once when /status-batch covers many employee-days.
+    status_list_concurrency: int = int(os.getenv("STATUS_LIST_CONCURRENCY", "8"))
+    # Read recordings over HTTP range requests instead of downloading them first.
+    s3_stream_frames: bool = _as_bool(os.getenv("S3_STREAM_FRAMES"), False)
+    s3_stream_base_url: str = os.getenv("S3_STREAM_BASE_URL", "")
+    s3_stream_seeks_per_process: int = int(os.getenv("S3_STREAM_SEEKS_PER_PROCESS", "10"))
 
     mongodb_uri: str = os.getenv("MONGODB_URI", "")
     mongodb_db: str = os.getenv("MONGODB_DB", "video-summarizer")
     mongo_server_selection_timeout_ms: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
     mongo_connect_timeout_ms: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
     mongo_socket_timeout_ms: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "60000"))
+    # Finished videos are saved MONGO_WRITE_BATCH_SIZE at a time, or once the oldest one has
+    # waited MONGO_WRITE_BATCH_MAX_WAIT_SEC, whichever comes first.
+    mongo_write_batch_size: int = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "10"))
+    mongo_write_batch_max_wait_sec: float = float(os.getenv("MONGO_WRITE_BATCH_MAX_WAIT_SEC", "5"))
+    mongo_transactions: bool = _as_bool(os.getenv("MONGO_TRANSACTIONS"), False)
 
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-5-mini")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")
+    # Every OpenAI call goes through one scheduler per process. RPM/TPM of 0 means "learn the
+    # account limits from the x-ratelimit-* response headers". Retries back off per retry-after.
+    openai_rpm_limit: int = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+    openai_tpm_limit: int = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+    openai_max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+    openai_backoff_base_sec: float = float(os.getenv("OPENAI_BACKOFF_BASE_SEC", "1.0"))
+    openai_backoff_max_sec: float = float(os.getenv("OPENAI_BACKOFF_MAX_SEC", "60"))
+    openai_timeout_sec: float = float(os.getenv("OPENAI_TIMEOUT_SEC", "120"))
+    # Expected completion tokens per call, reserved up front and settled from the reported usage.
+    openai_events_completion_estimate: int = int(os.getenv("OPENAI_EVENTS_COMPLETION_ESTIMATE", "4000"))
+    openai_vision_completion_estimate: int = int(os.getenv("OPENAI_VISION_COMPLETION_ESTIMATE", "300"))
     vision_enabled: bool = _as_bool(os.getenv("VISION_ENABLED", "true"), True)
+    # Per-video vision calls in flight, and the process-wide cap across all parallel jobs.
+    vision_concurrency: int = int(os.getenv("VISION_CONCURRENCY", "4"))
+    vision_max_inflight: int = int(os.getenv("VISION_MAX_INFLIGHT", "16"))
+    # Frames packed into one vision request (1 = one request per frame), bounded by a token budget.
+    vision_batch_size: int = int(os.getenv("VISION_BATCH_SIZE", "1"))
+    vision_batch_token_budget: int = int(os.getenv("VISION_BATCH_TOKEN_BUDGET", "12000"))
+    vision_image_token_estimate: int = int(os.getenv("VISION_IMAGE_TOKEN_ESTIMATE", "1105"))
+    # A video fails (and is retried on the next run) when more than this share of its frames
+    # could only get a placeholder description.
+    vision_max_fallback_ratio: float = float(os.getenv("VISION_MAX_FALLBACK_RATIO", "0.1"))
+
+    frame_cache_enabled: bool = _as_bool(os.getenv("FRAME_CACHE_ENABLED", "true"), True)
+    frame_cache_path: str = os.getenv(
+        "FRAME_CACHE_PATH",
+        os.path.join(os.path.expanduser("~"), ".cache", "video-analysis", "frame_descriptions.sqlite3"),
+    )
+    frame_cache_max_entries: int = int(os.getenv("FRAME_CACHE_MAX_ENTRIES", "50000"))
+
+    # Recordings longer than EVENT_WINDOW_SEC are synthesized in overlapping windows (0 disables).
+    event_window_sec: int = int(os.getenv("EVENT_WINDOW_SEC", "2700"))
+    event_window_overlap_sec: int = int(os.getenv("EVENT_WINDOW_OVERLAP_SEC", "180"))
+    event_window_concurrency: int = int(os.getenv("EVENT_WINDOW_CONCURRENCY", "4"))
 
     frame_interval_sec: int = int(os.getenv("FRAME_INTERVAL_SEC", "30"))
+    frame_keyframes_only: bool = _as_bool(os.getenv("FRAME_KEYFRAMES_ONLY"), False)
+    # "fixed" samples every FRAME_INTERVAL_SEC; "adaptive" follows ffmpeg scene-change scores.
+    frame_sampling: str = os.getenv("FRAME_SAMPLING", "fixed").strip().lower()
+    frame_scene_threshold: float = float(os.getenv("FRAME_SCENE_THRESHOLD", "0.3"))
+    frame_min_interval_sec: int = int(os.getenv("FRAME_MIN_INTERVAL_SEC", "5"))
+    frame_max_interval_sec: int = int(os.getenv("FRAME_MAX_INTERVAL_SEC", "60"))
+    frame_budget: int = int(os.getenv("FRAME_BUDGET", "240"))
+    # Resize/re-encode/crop frames before they are sent to the vision model.
+    frame_preprocess_enabled: bool = _as_bool(os.getenv("FRAME_PREPROCESS_ENABLED", "true"), True)
+    frame_max_width: int = int(os.getenv("FRAME_MAX_WIDTH", "1536"))
+    frame_max_height: int = int(os.getenv("FRAME_MAX_HEIGHT", "1536"))
+    frame_jpeg_quality: int = int(os.getenv("FRAME_JPEG_QUALITY", "80"))
+    frame_crop_top_px: int = int(os.getenv("FRAME_CROP_TOP_PX", "0"))
+    frame_crop_bottom_px: int = int(os.getenv("FRAME_CROP_BOTTOM_PX", "0"))
+    # Image detail sent to the model: auto, low, high, or adaptive (by frame size and busyness).
+    vision_detail: str = os.getenv("VISION_DETAIL", "auto").strip().lower()
+    vision_detail_high_min_bytes: int = int(os.getenv("VISION_DETAIL_HIGH_MIN_BYTES", "40000"))
+    # Max dHash Hamming distance (0-64) for a frame to reuse the previous description; -1 disables.
+    frame_dedup_max_distance: int = int(os.getenv("FRAME_DEDUP_MAX_DISTANCE", "4"))
+
+    # Per-video scratch directories live under SCRATCH_ROOT; ones left by crashed jobs are
+    # swept at startup and periodically once older than SCRATCH_MAX_AGE_SEC.
+    scratch_root: str = os.getenv("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "video-analysis"))
+    scratch_max_age_sec: int = int(os.getenv("SCRATCH_MAX_AGE_SEC", "86400"))
+    scratch_sweep_interval_sec: int = int(os.getenv("SCRATCH_SWEEP_INTERVAL_SEC", "3600"))
+    # Fixed-interval sampling streams frames from ffmpeg over a pipe and keeps them in memory,
+    # spilling to the scratch directory past FRAME_MEMORY_MAX_BYTES per video.
+    frame_pipe_mode: bool = _as_bool(os.getenv("FRAME_PIPE_MODE"), False)
+    frame_memory_max_bytes: int = int(os.getenv("FRAME_MEMORY_MAX_BYTES", str(256 * 1024 * 1024)))
+
+    # Stream the event-synthesis completion and persist each event as soon as it parses. Each
+    # video's log is then written on its own instead of in MONGO_WRITE_BATCH_SIZE batches.
+    events_streaming: bool = _as_bool(os.getenv("EVENTS_STREAMING"), False)
+
+    # Per-video stage results (probe, frames, transcript, events) kept in Mongo by S3 ETag, so a
+    # reprocess or a crashed run only redoes stages whose inputs changed. Expire after N days.
+    artifacts_enabled: bool = _as_bool(os.getenv("ARTIFACTS_ENABLED", "true"), True)
+    artifacts_ttl_days: int = int(os.getenv("ARTIFACTS_TTL_DAYS", "30"))
+
+    # Each video is claimed with a Mongo lease before it is prepared, so replicas sharing a
+    # backlog never process it twice. Leases are renewed every CLAIM_HEARTBEAT_SEC and can be
+    # taken over by another worker once CLAIM_LEASE_SEC passes without a renewal.
+    claims_enabled: bool = _as_bool(os.getenv("CLAIMS_ENABLED", "true"), True)
+    claim_lease_sec: int = int(os.getenv("CLAIM_LEASE_SEC", "300"))
+    claim_heartbeat_sec: int = int(os.getenv("CLAIM_HEARTBEAT_SEC", "60"))
+
+    # Videos downloaded and extracted ahead of the one currently waiting on GPT.
+    pipeline_prefetch: int = int(os.getenv("PIPELINE_PREFETCH", "1"))
+    # (employee, date) pairs processed in parallel by /process; executor is "thread" or "process".
+    process_max_parallel: int = int(os.getenv("PROCESS_MAX_PARALLEL", "4"))
+    process_executor: str = os.getenv("PROCESS_EXECUTOR", "thread").strip().lower()
+
+    # HTTP endpoints read Mongo and S3 through motor / aiobotocore when installed. Without them
+    # (or with ASYNC_CLIENTS_ENABLED=false) the blocking clients run on ASYNC_IO_THREADS threads.
+    async_clients_enabled: bool = _as_bool(os.getenv("ASYNC_CLIENTS_ENABLED", "true"), True)
+    async_io_threads: int = int(os.getenv("ASYNC_IO_THREADS", "16"))
+
+    # Background executor for /process and /reprocess jobs, and the SSE polling interval.
+    job_workers: int = int(os.getenv("JOB_WORKERS", "2"))
+    job_events_poll_sec: float = float(os.getenv("JOB_EVENTS_POLL_SEC", "1.0"))
+    # Live jobs are touched every JOB_HEARTBEAT_SEC; an unfinished job untouched for
+    # JOB_STALE_SEC belonged to a process that died and is marked failed.
+    job_heartbeat_sec: int = int(os.getenv("JOB_HEARTBEAT_SEC", "30"))
+    job_stale_sec: int = int(os.getenv("JOB_STALE_SEC", "300"))
 
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     uvicorn_log_level: str = os.getenv("UVICORN_LOG_LEVEL", "info")
@@ -1,13 +1,26 @@
-from datetime import datetime
-from typing import Dict, List, Optional
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, DeleteMany, ReplaceOne, UpdateOne
 from pymongo.collection import Collection
 
 from .config import get_settings
+from .metrics import stage_timer
+from .s3_utils import parse_timestamp_from_filename
 
 
+logger = logging.getLogger("video-analysis.db")
+
 _client: Optional[MongoClient] = None
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+# Also read by aio's motor client, which must not build the blocking client just for a name.
+PROCESSED_COLLECTION = "processed"
+JOBS_COLLECTION = "jobs"
 
 def _get_client() -> MongoClient:
     global _client
@@ -28,42 +41,366 @@ def _db():
 
 
 def processed_col() -> Collection:
-    col = _db()["processed"]
-    col.create_index([("employeeID", ASCENDING), ("fileName", ASCENDING)], unique=True)
-    return col
+    return _db()[PROCESSED_COLLECTION]
+
+
+def ensure_indexes():
+    # Called once at startup (and lazily by workers); create_index is a server round-trip.
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    with _indexes_lock:
+        if _indexes_ready:
+            return
+        processed_col().create_index([("employeeID", ASCENDING), ("fileName", ASCENDING)], unique=True)
+        processed_col().create_index([("employeeID", ASCENDING), ("date", ASCENDING)])
+        logs_col().create_index([("employeeID", ASCENDING), ("fileName", ASCENDING)])
+        logs_col().create_index([("employeeID", ASCENDING), ("date", ASCENDING)])
+        logs_col().create_index([("team", ASCENDING), ("date", ASCENDING)])
+        employee_rollups_col().create_index([("employeeID", ASCENDING), ("date", ASCENDING)], unique=True)
+        employee_rollups_col().create_index([("team", ASCENDING), ("date", ASCENDING)])
+        team_rollups_col().create_index([("team", ASCENDING), ("date", ASCENDING)], unique=True)
+        team_rollups_col().create_index("date")
+        # Claims whose lease lapsed a day ago belong to workers that are long gone.
+        claims_col().create_index("leaseUntil", expireAfterSeconds=86400)
+        ttl_days = get_settings().artifacts_ttl_days
+        if ttl_days > 0:
+            artifacts_col().create_index("updatedAt", expireAfterSeconds=ttl_days * 86400)
+        _indexes_ready = True
+        logger.info("Mongo indexes ensured")
 
 
 def logs_col() -> Collection:
     return _db()["event_logs"]
 
 
+def jobs_col() -> Collection:
+    return _db()[JOBS_COLLECTION]
+
+
+def artifacts_col() -> Collection:
+    return _db()["artifacts"]
+
+
+def claims_col() -> Collection:
+    return _db()["claims"]
+
+
+def employee_rollups_col() -> Collection:
+    return _db()["rollups_employee_day"]
+
+
+def team_rollups_col() -> Collection:
+    return _db()["rollups_team_day"]
+
+
+def rollup_sources_col() -> Collection:
+    return _db()["rollup_sources"]
+
+
 def is_processed(employee_id: str, file_name: str) -> bool:
     doc = processed_col().find_one({"employeeID": employee_id, "fileName": file_name})
     return doc is not None
 
 
-def mark_processed(employee_id: str, file_name: str):
-    processed_col().update_one(
-        {"employeeID": employee_id, "fileName": file_name},
-        {"$set": {"processedAt": datetime.utcnow()}},
-        upsert=True,
+def processed_file_names(employee_id: str, file_names: Iterable[str]) -> Set[str]:
+    # One query for a whole employee-day instead of an is_processed() lookup per video.
+    names = list(file_names)
+    if not names:
+        return set()
+    cursor = processed_col().find(
+        {"employeeID": employee_id, "fileName": {"$in": names}}, {"fileName": 1, "_id": 0}
     )
+    return set(d["fileName"] for d in cursor)
+
+
+def _marker_fields(date: Optional[str], now: datetime) -> Dict:
+    # The recording date lets /status read one employee-day from the (employeeID, date) index.
+    fields: Dict = {"processedAt": now}
+    if date:
+        fields["date"] = date
+    return fields
 
 
 def unmark_processed(employee_id: str, file_name: str):
-    processed_col().delete_one({"employeeID": employee_id, "fileName": file_name})
+    with stage_timer("mongo_write"):
+        processed_col().delete_one({"employeeID": employee_id, "fileName": file_name})
+
+
+def save_incomplete_event_log(document: Dict):
+    # A partial result (a window or the event stream failed): kept for inspection, replacing
+    # any earlier partial log of the file, and left unmarked so the next run redoes it.
+    document = dict(document, status="incomplete", processedAt=datetime.utcnow())
+    with stage_timer("mongo_write"):
+        logs_col().delete_many(
+            {"employeeID": document["employeeID"], "fileName": document["fileName"], "status": "incomplete"}
+        )
+        logs_col().insert_one(document)
+
+
+def save_event_logs_and_mark_processed(documents: List[Dict]):
+    # Writes a batch of event logs and their processed markers: two bulk_writes, wrapped in a
+    # transaction when MONGO_TRANSACTIONS is enabled (requires a replica set). Without one,
+    # each log replaces the file's earlier log (and any partial ones) instead of adding
+    # another, so a crash between the two writes is repaired by simply redoing the file.
+    if not documents:
+        return
+    now = datetime.utcnow()
+    logs = []
+    for doc in documents:
+        doc["processedAt"] = now
+        file_filter = {"employeeID": doc["employeeID"], "fileName": doc["fileName"]}
+        logs.append(DeleteMany(dict(file_filter, status={"$in": ["streaming", "incomplete"]})))
+        logs.append(ReplaceOne(file_filter, doc, upsert=True))
+    markers = [
+        UpdateOne(
+            {"employeeID": doc["employeeID"], "fileName": doc["fileName"]},
+            {"$set": _marker_fields(doc.get("date"), now)},
+            upsert=True,
+        )
+        for doc in documents
+    ]
+
+    def write(session=None):
+        logs_col().bulk_write(logs, ordered=True, session=session)
+        processed_col().bulk_write(markers, ordered=False, session=session)
+
+    with stage_timer("mongo_write"):
+        if get_settings().mongo_transactions:
+            with _get_client().start_session() as session:
+                session.with_transaction(lambda sess: write(sess))
+        else:
+            write()
+
+
+class EventLogBatch:
+    # Buffers finished videos and flushes them MONGO_WRITE_BATCH_SIZE at a time, or once the
+    # oldest has waited max_wait_sec, so a crash loses little and "done" is not held back.
+
+    def __init__(self, size: int, max_wait_sec: float = 0.0):
+        self.size = max(1, size)
+        self.max_wait_sec = max_wait_sec
+        self.documents: List[Dict] = []
+        self._oldest = 0.0
+
+    def add(self, document: Dict) -> bool:
+        if not self.documents:
+            self._oldest = time.monotonic()
+        self.documents.append(document)
+        return self.due()
+
+    def due(self) -> bool:
+        if not self.documents:
+            return False
+        if len(self.documents) >= self.size:
+            return True
+        return time.monotonic() - self._oldest >= self.max_wait_sec
+
+    def flush(self) -> List[Dict]:
+        flushed, self.documents = self.documents, []
+        save_event_logs_and_mark_processed(flushed)
+        return flushed
+
 
+class StreamedEventLog:
+    # Streaming mode: the event log is inserted with the first streamed event and each later
+    # event is pushed onto it as it arrives, so a crash or a truncated reply keeps what was
+    # parsed. finish() writes the final list (windowed runs merge and renumber) and marks the
+    # file. An incomplete result is kept with status "incomplete" and left unmarked, so it is
+    # redone; abandon() does the same for a run that failed, or drops the log if it is empty.
 
-def save_event_log(document: Dict):
-    document["processedAt"] = datetime.utcnow()
-    logs_col().insert_one(document)
+    def __init__(self, document: Dict):
+        self.document = document
+        self.employee_id = document["employeeID"]
+        self.file_name = document["fileName"]
+        self.date = document.get("date")
+        self.appended: List[Dict] = []
+        self._id = None
+        self._finished = False
+        self._lock = threading.Lock()
 
+    def _create(self, events: List[Dict], status: str) -> None:
+        # Called with the lock held.
+        logs_col().delete_many(
+            {
+                "employeeID": self.employee_id,
+                "fileName": self.file_name,
+                "status": {"$in": ["streaming", "incomplete"]},
+            }
+        )
+        self._id = logs_col().insert_one(
+            dict(self.document, events=list(events), status=status, startedAt=datetime.utcnow())
+        ).inserted_id
+
+    def append(self, event: Dict) -> None:
+        with self._lock, stage_timer("mongo_write"):
+            if self._id is None:
+                self._create([event], "streaming")
+            else:
+                logs_col().update_one({"_id": self._id}, {"$push": {"events": event}})
+            self.appended.append(event)
+
+    def finish(self, events: List[Dict], complete: bool = True) -> None:
+        now = datetime.utcnow()
+        if complete:
+            update: Dict = {"$set": {"processedAt": now}, "$unset": {"status": ""}}
+        else:
+            update = {"$set": {"processedAt": now, "status": "incomplete"}}
+        with self._lock, stage_timer("mongo_write"):
+            self._finished = True
+            if self._id is None:
+                self._create(events, "streaming")
+            elif events != self.appended:
+                update["$set"]["events"] = events
+            logs_col().update_one({"_id": self._id}, update)
+            if not complete:
+                return
+            # This log now supersedes earlier ones of the file (reprocess, or a crash before
+            # the marker below was written), so a replay never leaves two.
+            logs_col().delete_many(
+                {"employeeID": self.employee_id, "fileName": self.file_name, "_id": {"$ne": self._id}}
+            )
+            processed_col().update_one(
+                {"employeeID": self.employee_id, "fileName": self.file_name},
+                {"$set": _marker_fields(self.date, now)},
+                upsert=True,
+            )
+
+    def abandon(self) -> None:
+        with self._lock:
+            if self._finished or self._id is None:
+                return
+            self._finished = True
+            with stage_timer("mongo_write"):
+                if self.appended:
+                    logs_col().update_one(
+                        {"_id": self._id}, {"$set": {"status": "incomplete", "processedAt": datetime.utcnow()}}
+                    )
+                else:
+                    logs_col().delete_one({"_id": self._id})
+
+
+def status_query(listings: Dict[Tuple[str, str], List[str]]) -> Dict:
+    # Processed markers for many (employee, date) pairs in one indexed query. Markers
+    # written before they carried a date are matched by file name until backfilled.
+    employees = sorted(set(emp for emp, _ in listings))
+    dates = sorted(set(dt for _, dt in listings))
+    names = sorted(set(n for files in listings.values() for n in files))
+    clauses: List[Dict] = [{"employeeID": {"$in": employees}, "date": {"$in": dates}}]
+    if names:
+        clauses.append({"employeeID": {"$in": employees}, "fileName": {"$in": names}, "date": {"$exists": False}})
+    return {"$or": clauses}
+
+
+STATUS_PROJECTION = {"employeeID": 1, "fileName": 1, "_id": 0}
+
+
+def statuses_from(listings: Dict[Tuple[str, str], List[str]], markers: Iterable[Dict]) -> List[Dict]:
+    processed_files = set((d["employeeID"], d["fileName"]) for d in markers)
+    statuses = []
+    for (emp, dt), files in listings.items():
+        s3_set = set(files)
+        done = set(n for n in s3_set if (emp, n) in processed_files)
+        statuses.append(
+            {"employeeID": emp, "date": dt, "processed": sorted(done), "pending": sorted(s3_set - done)}
+        )
+    return statuses
+
+
+def get_statuses(listings: Dict[Tuple[str, str], List[str]]) -> List[Dict]:
+    if not listings:
+        return []
+    with stage_timer("mongo_read"):
+        markers = list(processed_col().find(status_query(listings), STATUS_PROJECTION))
+    return statuses_from(listings, markers)
+
+
+def migrations_col() -> Collection:
+    return _db()["migrations"]
+
+
+PROCESSED_DATES_MIGRATION = "processed-dates"
 
-def get_status(employee_id: str, date: str, s3_list: List[str]) -> Dict:
-    processed_files = set(
-        d["fileName"] for d in processed_col().find({"employeeID": employee_id}, {"fileName": 1, "_id": 0})
+
+def backfill_processed_dates(batch_size: int = 500) -> int:
+    # One-off migration: adds the recording date, parsed from the file name, to markers written
+    # before it was stored. Markers whose name has no date get date None, so nothing is left
+    # behind, and completion is recorded so later startups skip the scan altogether.
+    if migrations_col().find_one({"_id": PROCESSED_DATES_MIGRATION}) is not None:
+        return 0
+    col = processed_col()
+    updated = 0
+    ops: List[UpdateOne] = []
+    for doc in col.find({"date": {"$exists": False}}, {"fileName": 1}):
+        ts = parse_timestamp_from_filename(doc.get("fileName", ""))
+        date = ts.strftime("%Y-%m-%d") if ts is not None else None
+        ops.append(UpdateOne({"_id": doc["_id"], "date": {"$exists": False}}, {"$set": {"date": date}}))
+        if len(ops) >= batch_size:
+            updated += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += col.bulk_write(ops, ordered=False).modified_count
+    migrations_col().update_one(
+        {"_id": PROCESSED_DATES_MIGRATION}, {"$set": {"doneAt": datetime.utcnow(), "updated": updated}}, upsert=True
+    )
+    logger.info(f"Backfilled the date on {updated} processed markers")
+    return updated
+
+
+def create_job(job_id: str, kind: str, employees: List[str], dates: List[str]) -> Dict:
+    now = datetime.utcnow()
+    doc = {
+        "_id": job_id,
+        "kind": kind,
+        "employees": employees,
+        "dates": dates,
+        "status": "queued",
+        "events": [],
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    jobs_col().insert_one(doc)
+    return doc
+
+
+def update_job(job_id: str, fields: Dict):
+    fields = dict(fields)
+    fields["updatedAt"] = datetime.utcnow()
+    jobs_col().update_one({"_id": job_id}, {"$set": fields})
+
+
+def append_job_event(job_id: str, event: Dict):
+    now = datetime.utcnow()
+    event = dict(event)
+    event["at"] = now
+    jobs_col().update_one({"_id": job_id}, {"$push": {"events": event}, "$set": {"updatedAt": now}})
+
+
+def get_job(job_id: str, events_from: int = 0) -> Optional[Dict]:
+    return jobs_col().find_one({"_id": job_id}, job_projection(events_from))
+
+
+def touch_jobs(job_ids: Iterable[str]) -> None:
+    ids = list(job_ids)
+    if ids:
+        jobs_col().update_many({"_id": {"$in": ids}}, {"$set": {"updatedAt": datetime.utcnow()}})
+
+
+def fail_stale_jobs(max_age_sec: int, job_id: Optional[str] = None) -> int:
+    # Unfinished jobs whose owner stopped touching them (it died or restarted) are marked failed.
+    now = datetime.utcnow()
+    query: Dict = {"status": {"$in": ["queued", "running"]}, "updatedAt": {"$lt": now - timedelta(seconds=max_age_sec)}}
+    if job_id is not None:
+        query["_id"] = job_id
+    result = jobs_col().update_many(
+        query,
+        {"$set": {"status": "failed", "error": "job stopped updating; its worker probably restarted", "updatedAt": now}},
     )
-    s3_set = set(s3_list)
-    processed = sorted(list(s3_set & processed_files))
-    pending = sorted(list(s3_set - processed_files))
-    return {"employeeID": employee_id, "date": date, "processed": processed, "pending": pending}
+    if result.modified_count:
+        logger.warning(f"Marked {result.modified_count} stale jobs failed")
+    return result.modified_count
+
+
+def job_projection(events_from: int = 0) -> Optional[Dict]:
+    # events_from lets pollers fetch only the progress events they have not seen yet.
+    return {"events": {"$slice": [events_from, 1_000_000]}} if events_from else None
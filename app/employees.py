@@ -0,0 +1,161 @@
+import json
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("video-analysis.employees")
+
+UNKNOWN_EMPLOYEE = {"fullName": "Unknown", "team": "Unknown"}
+
+
+def employee_map_path() -> str:
+    return os.path.join(os.path.dirname(__file__), "employee_map.json")
+
+
+def _normalize_dict_entry(v: Dict) -> Dict[str, str]:
+    first = v.get("First Name") or v.get("first_name") or v.get("firstName") or ""
+    last = v.get("Last Name") or v.get("last_name") or v.get("lastName") or ""
+    if not v.get("fullName"):
+        full = f"{str(first).strip()} {str(last).strip()}".strip()
+    else:
+        full = str(v.get("fullName", "")).strip()
+    team = v.get("Department") or v.get("Team") or v.get("department") or v.get("team") or v.get("group") or "Unknown"
+    email = v.get("Email") or v.get("email") or ""
+    return {"fullName": full or "Unknown", "team": str(team) or "Unknown", "email": str(email).strip()}
+
+
+def _normalize_row(row: Dict) -> Optional[Tuple[str, Dict[str, str]]]:
+    emp_id = row.get("Employee ID") or row.get("employee_id") or row.get("id")
+    if not emp_id:
+        return None
+    emp_id = str(emp_id).strip()
+    first = row.get("First Name") or row.get("first_name") or row.get("FirstName") or ""
+    last = row.get("Last Name") or row.get("last_name") or row.get("LastName") or ""
+    first_str = str(first).strip() if first is not None else ""
+    last_str = str(last).strip() if last is not None and str(last) != "0" else ""
+    full = f"{first_str} {last_str}".strip() if last_str else first_str
+    dept = row.get("Department") or row.get("Team") or row.get("department") or row.get("team") or row.get("group") or "Unknown"
+    team = str(dept).strip() if dept is not None else "Unknown"
+    email = row.get("Email") or row.get("email") or ""
+    return emp_id, {"fullName": full or "Unknown", "team": team or "Unknown", "email": str(email).strip()}
+
+
+def parse_employee_map(raw) -> Dict[str, Dict[str, str]]:
+    if isinstance(raw, dict):
+        return {str(k): _normalize_dict_entry(v) for k, v in raw.items() if isinstance(v, dict)}
+    if isinstance(raw, list):
+        mapping: Dict[str, Dict[str, str]] = {}
+        for row in raw:
+            if not isinstance(row, dict):
+                continue
+            parsed = _normalize_row(row)
+            if parsed:
+                mapping[parsed[0]] = parsed[1]
+        return mapping
+    return {}
+
+
+class _DirectoryIndex:
+    # Immutable snapshot of the parsed file; swapped in as a whole on reload.
+
+    def __init__(self, by_id: Dict[str, Dict[str, str]], mtime: Optional[float]):
+        self.by_id = by_id
+        self.mtime = mtime
+        self.by_email: Dict[str, str] = {}
+        self.by_team: Dict[str, List[str]] = {}
+        for emp_id, info in by_id.items():
+            if info.get("email"):
+                self.by_email[info["email"].lower()] = emp_id
+            self.by_team.setdefault(info["team"].lower(), []).append(emp_id)
+
+
+class EmployeeDirectory:
+    # Parses employee_map.json once and re-parses only when the file's mtime changes.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = _DirectoryIndex({}, None)
+        self._loaded = False
+
+    def _current(self) -> _DirectoryIndex:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        index = self._index
+        if self._loaded and index.mtime == mtime:
+            return index
+        with self._lock:
+            if self._loaded and self._index.mtime == mtime:
+                return self._index
+            by_id: Dict[str, Dict[str, str]] = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, "r") as f:
+                        by_id = parse_employee_map(json.load(f))
+                except Exception as ex:
+                    # Keep serving the previous snapshot if the file is mid-write or broken.
+                    logger.warning(f"Could not reload {self.path}: {ex}")
+                    return self._index
+            self._index = _DirectoryIndex(by_id, mtime)
+            self._loaded = True
+            logger.info(f"Loaded {len(by_id)} employees from {self.path}")
+            return self._index
+
+    def get(self, employee_id: str) -> Optional[Dict[str, str]]:
+        return self._current().by_id.get(str(employee_id))
+
+    def find_by_email(self, email: str) -> Optional[str]:
+        return self._current().by_email.get(email.strip().lower())
+
+    def members_of(self, team: str) -> List[str]:
+        return list(self._current().by_team.get(team.strip().lower(), []))
+
+    def all(self) -> Dict[str, Dict[str, str]]:
+        return dict(self._current().by_id)
+
+
+_directory: Optional[EmployeeDirectory] = None
+_directory_lock = threading.Lock()
+
+
+def get_directory() -> EmployeeDirectory:
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = EmployeeDirectory(employee_map_path())
+    return _directory
+
+
+def get_employee_info(employee_id: str) -> Dict[str, str]:
+    info = get_directory().get(employee_id)
+    if not isinstance(info, dict):
+        return dict(UNKNOWN_EMPLOYEE)
+    return {"fullName": str(info.get("fullName") or "Unknown"), "team": str(info.get("team") or "Unknown")}
+
+
+def resolve_employee_ids(tokens: List[str]) -> List[str]:
+    # Expands "team:<Department>" and "email:<address>" tokens; plain tokens are employee ids.
+    directory = get_directory()
+    resolved: List[str] = []
+    for token in tokens:
+        kind, _, value = token.partition(":")
+        kind = kind.strip().lower()
+        if value and kind == "team":
+            members = directory.members_of(value)
+            if not members:
+                logger.warning(f"No employees found for team {value}")
+            resolved.extend(members)
+        elif value and kind == "email":
+            emp_id = directory.find_by_email(value)
+            if emp_id:
+                resolved.append(emp_id)
+            else:
+                logger.warning(f"No employee found for email {value}")
+        else:
+            resolved.append(token)
+    seen = set()
+    return [e for e in resolved if not (e in seen or seen.add(e))]
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from .config import get_settings
+
+logger = logging.getLogger("video-analysis.frame-cache")
+
+
+def cache_key(image_bytes: bytes, model: str, prompt_version: str) -> str:
+    h = hashlib.sha256()
+    h.update(image_bytes)
+    h.update(b"\0")
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt_version.encode("utf-8"))
+    return h.hexdigest()
+
+
+# The row count is tracked in memory; it is re-read every RECOUNT_EVERY writes because other
+# processes (PROCESS_EXECUTOR=process) may share the file. Eviction trims EVICT_SLACK of the
+# capacity beyond the excess, so a full cache does not evict on every write.
+RECOUNT_EVERY = 1000
+EVICT_SLACK = 0.05
+
+
+class FrameDescriptionCache:
+    # Content-addressed store of frame descriptions in a single SQLite file.
+    # last_used is bumped on every hit so eviction drops the least recently used rows.
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS frame_descriptions ("
+            "key TEXT PRIMARY KEY, description TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS frame_descriptions_last_used ON frame_descriptions (last_used)"
+        )
+        self._entries = self._count()
+        self._writes = 0
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM frame_descriptions").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT description FROM frame_descriptions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE frame_descriptions SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, description: str) -> None:
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE frame_descriptions SET description = ?, last_used = ? WHERE key = ?",
+                (description, time.time(), key),
+            ).rowcount
+            if updated:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO frame_descriptions (key, description, last_used) VALUES (?, ?, ?)",
+                (key, description, time.time()),
+            )
+            self._entries += 1
+            self._writes += 1
+            if self._writes % RECOUNT_EVERY == 0:
+                self._entries = self._count()
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        excess = self._entries - self.max_entries + int(self.max_entries * EVICT_SLACK)
+        if excess <= 0:
+            return
+        self._entries -= self._conn.execute(
+            "DELETE FROM frame_descriptions WHERE key IN "
+            "(SELECT key FROM frame_descriptions ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        ).rowcount
+        logger.info(f"Evicted {excess} frame descriptions from cache {self.path}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._entries, "maxEntries": self.max_entries}
+
+
+_cache: Optional[FrameDescriptionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_frame_cache() -> Optional[FrameDescriptionCache]:
+    global _cache
+    s = get_settings()
+    if not s.frame_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = FrameDescriptionCache(s.frame_cache_path, s.frame_cache_max_entries)
+                except Exception as ex:
+                    logger.warning(f"Frame description cache unavailable at {s.frame_cache_path}: {ex}")
+                    return None
+    return _cache
@@ -0,0 +1,198 @@
+import io
+import math
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image  # type: ignore
+except Exception:
+    Image = None  # type: ignore
+
+from .video_processor import FrameSource
+
+logger = logging.getLogger("video-analysis.frames")
+
+HASH_SIZE = 8
+
+
+def _require_pillow():
+    if Image is None:
+        raise ImportError(
+            "Pillow is required for frame hashing. Install it with 'pip install Pillow' or 'pip install -r requirements.txt' in your active venv."
+        )
+
+
+def read_frame(frame: FrameSource) -> bytes:
+    if isinstance(frame, (bytes, bytearray)):
+        return bytes(frame)
+    with open(frame, "rb") as f:
+        return f.read()
+
+
+def _open_image(frame: FrameSource):
+    return Image.open(io.BytesIO(frame) if isinstance(frame, (bytes, bytearray)) else frame)
+
+
+def frame_hash(frame: FrameSource) -> int:
+    # dHash: compare neighbouring pixels of a tiny grayscale thumbnail, 64 bits per frame.
+    _require_pillow()
+    with _open_image(frame) as img:
+        small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+        pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def dedupe_frames(
+    frames: List[Tuple[FrameSource, int]],
+    max_distance: int,
+    hashes: Optional[Dict[int, int]] = None,
+) -> Dict[int, int]:
+    # Maps each near-duplicate frame's timestamp to the timestamp whose description it reuses.
+    # Frames are compared with the last frame that was kept, so slow drift still starts a new one.
+    # Pass a dict as `hashes` to collect each frame's hash by timestamp.
+    reuse: Dict[int, int] = {}
+    if max_distance < 0 or len(frames) < 2:
+        return reuse
+    if Image is None:
+        logger.warning("Pillow is not installed; skipping frame deduplication")
+        return reuse
+
+    prev_hash: Optional[int] = None
+    prev_ts: Optional[int] = None
+    for fp, ts in frames:
+        try:
+            h = frame_hash(fp)
+        except Exception as ex:
+            logger.warning(f"Could not hash frame at {ts}s: {ex}")
+            prev_hash, prev_ts = None, None
+            continue
+        if hashes is not None:
+            hashes[ts] = h
+        if prev_hash is not None and hamming_distance(h, prev_hash) <= max_distance:
+            reuse[ts] = prev_ts
+            continue
+        prev_hash, prev_ts = h, ts
+    return reuse
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    # OpenAI vision pricing: "low" is a flat 85 tokens; otherwise the image is fit into
+    # 2048x2048, its short side scaled to 768, and billed 170 per 512px tile plus 85.
+    if detail == "low":
+        return 85
+    if width <= 0 or height <= 0:
+        return 85
+    scale = min(1.0, 2048.0 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768.0 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / 512.0) * math.ceil(h / 512.0)
+    return 85 + 170 * tiles
+
+
+def choose_detail(width: int, height: int, size_bytes: int, policy: str, high_min_bytes: int) -> str:
+    # "adaptive" pays for high detail only when the frame is big and busy enough to have
+    # readable text; JPEG size is a cheap proxy for how much is on screen.
+    if policy in {"low", "high", "auto"}:
+        return policy
+    if max(width, height) <= 512 or size_bytes < high_min_bytes:
+        return "low"
+    return "high"
+
+
+def image_size(image_bytes: bytes) -> Tuple[int, int]:
+    _require_pillow()
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return img.size
+
+
+def detail_for_image(image_bytes: bytes, policy: str, high_min_bytes: int) -> str:
+    if policy in {"low", "high", "auto"}:
+        return policy
+    if Image is None:
+        return "auto"
+    width, height = image_size(image_bytes)
+    return choose_detail(width, height, len(image_bytes), policy, high_min_bytes)
+
+
+def preprocess_frame(
+    frame: FrameSource,
+    max_width: int,
+    max_height: int,
+    quality: int,
+    crop_top: int = 0,
+    crop_bottom: int = 0,
+) -> Tuple[FrameSource, Dict[str, int]]:
+    # Crops OS chrome, downsizes to fit max_width x max_height and re-encodes. Frames on
+    # disk are rewritten in place; in-memory frames come back as new bytes.
+    _require_pillow()
+    in_memory = isinstance(frame, (bytes, bytearray))
+    original_bytes = len(frame) if in_memory else os.path.getsize(frame)
+    with _open_image(frame) as img:
+        img = img.convert("RGB")
+        width, height = img.size
+        if (crop_top or crop_bottom) and crop_top + crop_bottom < height:
+            img = img.crop((0, crop_top, width, height - crop_bottom))
+        if max_width > 0 and max_height > 0:
+            img.thumbnail((max_width, max_height), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        new_width, new_height = img.size
+    data = out.getvalue()
+    stats = {
+        "width": new_width,
+        "height": new_height,
+        "originalBytes": original_bytes,
+        "bytes": len(data),
+    }
+    if in_memory:
+        return data, stats
+    with open(frame, "wb") as f:
+        f.write(data)
+    return frame, stats
+
+
+def preprocess_frames(
+    frames: List[Tuple[FrameSource, int]],
+    max_width: int,
+    max_height: int,
+    quality: int,
+    crop_top: int,
+    crop_bottom: int,
+    detail_policy: str,
+    high_min_bytes: int,
+) -> Tuple[List[Tuple[FrameSource, int]], Dict[str, int]]:
+    totals = {"frames": 0, "originalBytes": 0, "bytes": 0, "estimatedTokens": 0}
+    if Image is None:
+        logger.warning("Pillow is not installed; sending frames without preprocessing")
+        return frames, totals
+    processed: List[Tuple[FrameSource, int]] = []
+    for frame, ts in frames:
+        try:
+            frame, stats = preprocess_frame(frame, max_width, max_height, quality, crop_top, crop_bottom)
+        except Exception as ex:
+            logger.warning(f"Could not preprocess frame at {ts}s: {ex}")
+            processed.append((frame, ts))
+            continue
+        processed.append((frame, ts))
+        detail = choose_detail(stats["width"], stats["height"], stats["bytes"], detail_policy, high_min_bytes)
+        tokens = estimate_image_tokens(stats["width"], stats["height"], detail)
+        logger.debug(
+            f"Frame {ts}s: {stats['originalBytes']} -> {stats['bytes']} bytes, "
+            f"{stats['width']}x{stats['height']}, detail={detail}, ~{tokens} tokens"
+        )
+        totals["frames"] += 1
+        totals["originalBytes"] += stats["originalBytes"]
+        totals["bytes"] += stats["bytes"]
+        totals["estimatedTokens"] += tokens
+    return processed, totals
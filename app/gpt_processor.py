@@ -1,57 +1,318 @@
+import re
 import json
-from typing import Dict, List, Tuple
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 import base64
 import logging
 from openai import OpenAI
+from pydantic import ValidationError
 
 from .config import get_settings
-from .video_processor import hms
+from .video_processor import FrameSource, hms, hms_to_seconds
+from .frame_cache import cache_key, get_frame_cache
+from .frame_utils import detail_for_image, read_frame
+from .models import Event
+from .metrics import FRAMES, OPENAI_FALLBACKS, bind, count, observe_stage, record_openai_usage, stage_timer
+from .openai_scheduler import get_scheduler
 
 
 client = None
 logger = logging.getLogger("video-analysis.gpt")
 
+_vision_slots: Optional[threading.BoundedSemaphore] = None
+_vision_slots_lock = threading.Lock()
+
+def set_vision_inflight_limit(limit: int) -> None:
+    global _vision_slots
+    with _vision_slots_lock:
+        _vision_slots = threading.BoundedSemaphore(max(1, limit))
+
+
+def _vision_slot() -> threading.BoundedSemaphore:
+    # Process-wide cap on concurrent vision calls, shared by every job running in this process.
+    global _vision_slots
+    if _vision_slots is None:
+        with _vision_slots_lock:
+            if _vision_slots is None:
+                _vision_slots = threading.BoundedSemaphore(max(1, get_settings().vision_max_inflight))
+    return _vision_slots
+
+
 def _get_client():
     global client
     if client is None:
         api_key = get_settings().openai_api_key
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY is not set; set it in environment or .env")
-        client = OpenAI(api_key=api_key)
+        # Retries belong to the shared scheduler, not the SDK, so backoff is coordinated.
+        client = OpenAI(
+            api_key=api_key,
+            base_url=get_settings().openai_base_url or None,
+            max_retries=0,
+            timeout=get_settings().openai_timeout_sec,
+        )
     return client
 
 
-def analyze_frame(frame_path: str, timestamp: int) -> str:
+def _chat(kind: str, estimated_tokens: int, **kwargs):
+    # Every chat completion goes through the process-wide scheduler; non-streamed replies
+    # settle the token reservation from their reported usage right away.
+    cl = _get_client()
+    scheduler = get_scheduler()
+    result = scheduler.run(kind, estimated_tokens, lambda: cl.chat.completions.with_raw_response.create(**kwargs))
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        scheduler.settle(estimated_tokens, getattr(usage, "total_tokens", 0) or 0)
+    return result
+
+
+def _vision_estimate(images: int) -> int:
+    s = get_settings()
+    return images * (s.vision_image_token_estimate + s.openai_vision_completion_estimate) + 200
+
+
+FRAME_SYSTEM_PROMPT = "You are analyzing work session screenshots. Identify specific applications, documents, and activities only from what is visible."
+FRAME_USER_PROMPT = "Screenshot at {timestamp}. Identify: 1) Application and window title, 2) Document/file names visible, 3) Specific UI elements (buttons, menus, dialogs), 4) Any readable text (headers, cell values, email subjects), 5) Current user action (typing, clicking, scrolling). Be specific about what you see; do not infer beyond the image."
+# Bump whenever the frame prompts above change so cached descriptions are not reused.
+FRAME_PROMPT_VERSION = "1"
+
+
+FRAME_BATCH_PROMPT = "You will receive {count} screenshots from one work session, in chronological order, each preceded by its timestamp. For EACH screenshot identify: 1) Application and window title, 2) Document/file names visible, 3) Specific UI elements (buttons, menus, dialogs), 4) Any readable text (headers, cell values, email subjects), 5) Current user action (typing, clicking, scrolling). Be specific about what you see; do not infer beyond the image. Return only valid JSON: {{\"frames\": [{{\"timestamp\": \"HH:MM:SS\", \"description\": \"string\"}}]}} with exactly one entry per screenshot, using the timestamps given."
+FRAME_BATCH_PROMPT_VERSION = "batch-1"
+
+
+class VisionUsage:
+    # Per-video tally of vision calls and tokens, shared by the describe_frames workers.
+
+    def __init__(self):
+        self.calls = 0
+        self.frames = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, completion, frames: int) -> None:
+        usage = getattr(completion, "usage", None)
+        with self._lock:
+            self.calls += 1
+            self.frames += frames
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+
+def _placeholder_description(timestamp: int) -> str:
+    return f"At {hms(timestamp)}, the screen shows an application window with typical work UI elements."
+
+
+def _image_detail(image_bytes: bytes) -> str:
+    s = get_settings()
+    try:
+        return detail_for_image(image_bytes, s.vision_detail, s.vision_detail_high_min_bytes)
+    except Exception:
+        return "auto"
+
+
+def _image_part(image_bytes: bytes, detail: str) -> Dict:
+    b64 = base64.b64encode(image_bytes).decode("utf-8")
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": detail}}
+
+
+def _cache_get(cache, key: Optional[str]) -> Optional[str]:
+    # A failing frame cache (full disk, locked file) only bypasses the cache.
+    if not cache:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as ex:
+        logger.warning(f"Frame cache read failed: {ex}")
+        return None
+
+
+def _cache_put(cache, key: Optional[str], description: str) -> None:
+    if not cache:
+        return
+    try:
+        cache.put(key, description)
+    except Exception as ex:
+        logger.warning(f"Frame cache write failed: {ex}")
+
+
+def analyze_frame(frame_path: FrameSource, timestamp: int, usage: Optional[VisionUsage] = None) -> str:
     s = get_settings()
     if not s.vision_enabled:
-        return f"At {hms(timestamp)}, the screen shows an application window with typical work UI elements."
+        return _placeholder_description(timestamp)
     try:
-        with open(frame_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
-        data_url = f"data:image/jpeg;base64,{b64}"
-        cl = _get_client()
+        image_bytes = read_frame(frame_path)
+        detail = _image_detail(image_bytes)
+        cache = get_frame_cache()
+        key = cache_key(image_bytes, s.openai_model, f"{FRAME_PROMPT_VERSION}:{detail}") if cache else None
+        cached = _cache_get(cache, key)
+        if cached:
+            count(FRAMES, kind="cached")
+            return cached
         msg = [
-            {"role": "system", "content": "You are analyzing work session screenshots. Identify specific applications, documents, and activities only from what is visible."},
+            {"role": "system", "content": FRAME_SYSTEM_PROMPT},
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": f"Screenshot at {hms(timestamp)}. Identify: 1) Application and window title, 2) Document/file names visible, 3) Specific UI elements (buttons, menus, dialogs), 4) Any readable text (headers, cell values, email subjects), 5) Current user action (typing, clicking, scrolling). Be specific about what you see; do not infer beyond the image."},
-                    {"type": "image_url", "image_url": {"url": data_url}},
+                    {"type": "text", "text": FRAME_USER_PROMPT.format(timestamp=hms(timestamp))},
+                    _image_part(image_bytes, detail),
                 ],
             },
         ]
-        completion = cl.chat.completions.create(
-            model=s.openai_model,
-            messages=msg,
-        )
+        with _vision_slot(), stage_timer("vision_call"):
+            completion = _chat("vision", _vision_estimate(1), model=s.openai_model, messages=msg)
+        record_openai_usage(completion, "vision")
+        if usage is not None:
+            usage.record(completion, 1)
         content = (completion.choices[0].message.content or "").strip()
         if not content:
             logger.warning("Video frame description is empty; vision haved no response")
-            return f"At {hms(timestamp)}, the screen shows an application window with typical work UI elements."
+            count(OPENAI_FALLBACKS, kind="vision")
+            return _placeholder_description(timestamp)
+        count(FRAMES, kind="described")
+        _cache_put(cache, key, content)
         return content
     except Exception as ex:
         logger.exception(f"analyze_frame failed at {hms(timestamp)}: {ex}")
-        return f"At {hms(timestamp)}, the screen shows an application window with typical work UI elements."
+        count(OPENAI_FALLBACKS, kind="vision")
+        return _placeholder_description(timestamp)
+
+
+def analyze_frames_batch(frames: List[Tuple[FrameSource, int]], usage: Optional[VisionUsage] = None) -> Dict[int, str]:
+    # Packs several consecutive frames into one chat completion so the system prompt and
+    # instructions are paid for once. Returns only the frames the model actually described;
+    # callers fall back to analyze_frame for the rest.
+    s = get_settings()
+    results: Dict[int, str] = {}
+    cache = get_frame_cache()
+    todo: List[Tuple[int, bytes, str, Optional[str]]] = []
+    try:
+        for fp, ts in frames:
+            image_bytes = read_frame(fp)
+            detail = _image_detail(image_bytes)
+            key = cache_key(image_bytes, s.openai_model, f"{FRAME_BATCH_PROMPT_VERSION}:{detail}") if cache else None
+            cached = _cache_get(cache, key)
+            if cached:
+                count(FRAMES, kind="cached")
+                results[ts] = cached
+            else:
+                todo.append((ts, image_bytes, detail, key))
+        if not todo:
+            return results
+
+        content: List[Dict] = [{"type": "text", "text": FRAME_BATCH_PROMPT.format(count=len(todo))}]
+        for ts, image_bytes, detail, _ in todo:
+            content.append({"type": "text", "text": f"Screenshot at {hms(ts)}:"})
+            content.append(_image_part(image_bytes, detail))
+        with _vision_slot(), stage_timer("vision_call"):
+            completion = _chat(
+                "vision",
+                _vision_estimate(len(todo)),
+                model=s.openai_model,
+                messages=[
+                    {"role": "system", "content": FRAME_SYSTEM_PROMPT},
+                    {"role": "user", "content": content},
+                ],
+            )
+        record_openai_usage(completion, "vision")
+        if usage is not None:
+            usage.record(completion, len(todo))
+        parsed = coerce_json((completion.choices[0].message.content or "").strip() or "{}")
+        by_hms = {hms(ts): (ts, key) for ts, _, _, key in todo}
+        for entry in parsed.get("frames", []) if isinstance(parsed, dict) else []:
+            if not isinstance(entry, dict):
+                continue
+            match = by_hms.get(str(entry.get("timestamp", "")).strip())
+            desc = str(entry.get("description") or "").strip()
+            if match is None or not desc:
+                continue
+            ts, key = match
+            results[ts] = desc
+            count(FRAMES, kind="described")
+            _cache_put(cache, key, desc)
+    except Exception as ex:
+        logger.exception(f"analyze_frames_batch failed for {len(frames)} frames: {ex}")
+    return results
+
+
+def vision_batch_size() -> int:
+    # K frames per request, capped so the images alone stay within the per-request token budget.
+    s = get_settings()
+    if s.vision_batch_size <= 1:
+        return 1
+    per_image = max(1, s.vision_image_token_estimate)
+    return max(1, min(s.vision_batch_size, s.vision_batch_token_budget // per_image))
+
+
+def _describe_chunk(chunk: List[Tuple[FrameSource, int]], usage: VisionUsage) -> List[str]:
+    if len(chunk) == 1:
+        return [analyze_frame(chunk[0][0], chunk[0][1], usage)]
+    described = analyze_frames_batch(chunk, usage)
+    missing = [(fp, ts) for fp, ts in chunk if ts not in described]
+    if missing:
+        logger.warning(f"Batched vision reply missed {len(missing)} of {len(chunk)} frames; retrying them singly")
+        for fp, ts in missing:
+            described[ts] = analyze_frame(fp, ts, usage)
+    return [described[ts] for _, ts in chunk]
+
+
+def describe_frames(
+    frames: List[Tuple[FrameSource, int]],
+    reuse: Optional[Dict[int, int]] = None,
+    described: Optional[Dict[int, str]] = None,
+    on_described: Optional[Callable[[Dict[int, str]], None]] = None,
+) -> List[str]:
+    # Neither analyze_frame nor analyze_frames_batch raises, so one slow or failing request
+    # cannot stall the others; map() keeps results in frame order.
+    # Frames listed in `reuse` are near-duplicates and borrow another frame's description.
+    # Frames already in `described` (e.g. from an interrupted run) are not sent again, and
+    # on_described receives each chunk's fresh descriptions as soon as they arrive.
+    # Raises once the share of placeholder descriptions passes VISION_MAX_FALLBACK_RATIO.
+    reuse = reuse or {}
+    described = described or {}
+    unique = [(fp, ts) for fp, ts in frames if ts not in reuse and ts not in described]
+    k = vision_batch_size()
+    chunks = [unique[i : i + k] for i in range(0, len(unique), k)]
+    usage = VisionUsage()
+
+    def run(chunk: List[Tuple[FrameSource, int]]) -> List[str]:
+        descs = _describe_chunk(chunk, usage)
+        if on_described is not None:
+            fresh = {ts: d for (_, ts), d in zip(chunk, descs) if d != _placeholder_description(ts)}
+            if fresh:
+                try:
+                    on_described(fresh)
+                except Exception as ex:
+                    logger.warning(f"Could not record {len(fresh)} frame descriptions: {ex}")
+        return descs
+
+    workers = max(1, min(get_settings().vision_concurrency, len(chunks)))
+    if workers == 1:
+        chunk_desc = [run(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision") as pool:
+            chunk_desc = list(pool.map(bind(run), chunks))
+    unique_desc = [desc for descs in chunk_desc for desc in descs]
+    if usage.calls:
+        logger.info(
+            f"Vision usage: {usage.calls} calls for {len(unique)} frames (single-frame path: {len(unique)} calls), "
+            f"batch_size={k} prompt_tokens={usage.prompt_tokens} completion_tokens={usage.completion_tokens}"
+        )
+    if described:
+        logger.info(f"Reused {len(described)} stored frame descriptions")
+    if get_settings().vision_enabled and unique:
+        fallbacks = sum(1 for (_, ts), desc in zip(unique, unique_desc) if desc == _placeholder_description(ts))
+        if fallbacks > get_settings().vision_max_fallback_ratio * len(unique):
+            raise RuntimeError(f"{fallbacks} of {len(unique)} frames could not be described")
+
+    by_ts = dict(described)
+    by_ts.update((ts, desc) for (_, ts), desc in zip(unique, unique_desc))
+    return [by_ts[ts] if ts in by_ts else by_ts.get(reuse[ts], "") for _, ts in frames]
 
 
 def build_instruction(filename: str, duration_hms: str, transcript_block: str, employee_id: str, fullname: str, team: str, date: str) -> str:
@@ -160,6 +421,16 @@ Return only valid JSON with this schema example:
     return instruction
 
 
+EVENTS_SYSTEM_PROMPT = "You output only valid JSON."
+
+
+def event_prompt_version() -> str:
+    # Fingerprint of the event-synthesis prompt template, so stored event logs are redone
+    # when build_instruction changes and kept otherwise.
+    template = build_instruction("{filename}", "{duration}", "{transcript}", "{employee}", "{fullname}", "{team}", "{date}")
+    return hashlib.sha1((EVENTS_SYSTEM_PROMPT + template).encode("utf-8")).hexdigest()[:16]
+
+
 def coerce_json(text: str) -> Dict:
     try:
         return json.loads(text)
@@ -171,21 +442,429 @@ def coerce_json(text: str) -> Dict:
         raise
 
 
+def _empty_events_doc(filename: str, employee_id: str, fullname: str, team: str, date: str) -> Dict:
+    return {
+        "filename": filename,
+        "caseid": f"{employee_id}_{date}",
+        "employeeid": employee_id,
+        "fullname": fullname,
+        "team": team,
+        "date": date,
+        "events": [],
+    }
+
+
+EVENTS_ARRAY_RE = re.compile(r'"events"\s*:\s*\[')
+EVENTS_SEPARATOR_RE = re.compile(r"[,\]]")
+
+
+class EventStreamParser:
+    # Pulls each complete object out of the reply's "events" array while the completion is
+    # still streaming. Only the text of the object being read is held, never the whole reply.
+
+    def __init__(self):
+        self._buf = ""
+        self._in_array = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Dict]:
+        out: List[Dict] = []
+        if self.done:
+            return out
+        self._buf += text
+        if not self._in_array:
+            match = EVENTS_ARRAY_RE.search(self._buf)
+            if match is None:
+                self._buf = self._buf[-32:]  # enough to catch '"events": [' split across chunks
+                return out
+            self._buf = self._buf[match.end():]
+            self._in_array = True
+        while True:
+            start = 0
+            while start < len(self._buf) and self._buf[start] in " \t\r\n,":
+                start += 1
+            if start == len(self._buf):
+                self._buf = ""
+                return out
+            if self._buf[start] == "]":
+                self.done = True
+                self._buf = ""
+                return out
+            end = self._object_end(start)
+            if end == -1:
+                self._buf = self._buf[start:]
+                return out
+            raw, self._buf = self._buf[start:end], self._buf[end:]
+            try:
+                out.append(json.loads(raw))
+            except ValueError:
+                logger.warning(f"Skipping unparseable streamed event: {raw[:200]}")
+
+    def _object_end(self, start: int) -> int:
+        # Index just past the object starting at `start`, or -1 if it has not closed yet.
+        if self._buf[start] != "{":
+            # Not an object (the model strayed from the schema); skip up to the next separator.
+            match = EVENTS_SEPARATOR_RE.search(self._buf, start)
+            return match.start() if match else -1
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(self._buf)):
+            ch = self._buf[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        return -1
+
+
+def validate_event(obj) -> Optional[Dict]:
+    # The prompt asks for DurationMin as a string but models often send a number.
+    if not isinstance(obj, dict):
+        return None
+    data = dict(obj)
+    if data.get("DurationMin") is not None and not isinstance(data["DurationMin"], str):
+        data["DurationMin"] = str(data["DurationMin"])
+    try:
+        event = Event(**data)
+    except ValidationError as ex:
+        logger.warning(f"Dropping invalid event {data.get('StageSequenceID')}: {ex.errors()[:3]}")
+        return None
+    return event.model_dump() if hasattr(event, "model_dump") else event.dict()
+
+
+def _stream_events(prompt: str, on_event: Callable[[Dict], None]) -> Dict:
+    # Streaming variant of _synthesize_events: each event is validated and handed to on_event
+    # as soon as its object closes. If the stream breaks off, events already received are kept
+    # and "complete" is False, so callers do not store the partial list as final.
+    s = get_settings()
+    parser = EventStreamParser()
+    events: List[Dict] = []
+    broke_off = False
+    estimate = _events_estimate(prompt)
+    started = time.perf_counter()
+    with stage_timer("event_synthesis"):
+        try:
+            stream = _chat(
+                "events",
+                estimate,
+                model=s.openai_model,
+                messages=[
+                    {"role": "system", "content": EVENTS_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    record_openai_usage(chunk, "events")
+                    get_scheduler().settle(estimate, getattr(chunk.usage, "total_tokens", 0) or 0)
+                for choice in chunk.choices or []:
+                    delta = getattr(choice.delta, "content", None)
+                    if not delta:
+                        continue
+                    for obj in parser.feed(delta):
+                        event = validate_event(obj)
+                        if event is None:
+                            continue
+                        if not events:
+                            observe_stage("event_first_event", time.perf_counter() - started)
+                        events.append(event)
+                        try:
+                            on_event(event)
+                        except Exception as ex:
+                            logger.warning(f"Could not persist streamed event {event['StageSequenceID']}: {ex}")
+        except Exception as ex:
+            if not events:
+                raise
+            logger.warning(f"Event stream broke off after {len(events)} events; keeping them: {ex}")
+            count(OPENAI_FALLBACKS, kind="events_truncated")
+            broke_off = True
+    if not parser.done and not broke_off:
+        logger.warning(f"Event stream ended before the events array closed; kept {len(events)} events")
+        count(OPENAI_FALLBACKS, kind="events_truncated")
+    return {"events": events, "complete": parser.done and not broke_off}
+
+
+def _events_estimate(prompt: str) -> int:
+    return len(prompt) // 3 + get_settings().openai_events_completion_estimate
+
+
+def _synthesize_events(prompt: str, on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+    # One event-synthesis completion; raises on transport errors or unparseable output.
+    if on_event is not None:
+        return _stream_events(prompt, on_event)
+    s = get_settings()
+    with stage_timer("event_synthesis"):
+        completion = _chat(
+            "events",
+            _events_estimate(prompt),
+            model=s.openai_model,
+            messages=[
+                {"role": "system", "content": EVENTS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+        )
+    record_openai_usage(completion, "events")
+    text = (completion.choices[0].message.content or "").strip()
+    if not text:
+        raise RuntimeError("Event synthesis returned an empty response")
+    return coerce_json(text)
+
+
+def event_windows(duration_sec: int, window_sec: int, overlap_sec: int) -> List[Tuple[int, int, int, int]]:
+    # (start, end, own_start, own_end) per window. Neighbouring windows overlap by overlap_sec
+    # and each one owns the events that start in its half of every overlap.
+    window_sec = max(1, window_sec)
+    overlap_sec = max(0, min(overlap_sec, window_sec // 2))
+    step = window_sec - overlap_sec
+    windows: List[Tuple[int, int, int, int]] = []
+    start = 0
+    while True:
+        end = min(start + window_sec, duration_sec)
+        last = end >= duration_sec
+        own_start = 0 if not windows else start + overlap_sec // 2
+        own_end = duration_sec + 1 if last else end - overlap_sec // 2
+        windows.append((start, end, own_start, own_end))
+        if last:
+            return windows
+        start += step
+
+
+def _format_minutes(seconds: int) -> str:
+    return f"{seconds / 60.0:.2f}"
+
+
+def _owned_by(window: Tuple[int, int, int, int], event: Dict) -> bool:
+    # Events without a parseable StartTime stay with the window that produced them.
+    start = hms_to_seconds(event.get("StartTime"))
+    return start is None or window[2] <= start < window[3]
+
+
+def merge_window_events(window_events: List[Tuple[Tuple[int, int, int, int], List[Dict]]]) -> List[Dict]:
+    # Deterministic reduce step: keep each event only in the window that owns its start,
+    # order by start time, stitch the same activity across a window boundary into one event
+    # and renumber StageSequenceID.
+    kept: List[Tuple[int, int, Dict]] = []
+    for order, (window, events) in enumerate(window_events):
+        for event in events:
+            if not isinstance(event, dict) or not _owned_by(window, event):
+                continue
+            start = hms_to_seconds(event.get("StartTime"))
+            kept.append((start if start is not None else window[2], order, event))
+    kept.sort(key=lambda item: (item[0], item[1]))
+
+    merged: List[Dict] = []
+    prev_order = None
+    for _, order, event in kept:
+        event = dict(event)
+        if merged and prev_order is not None and order != prev_order:
+            prev = merged[-1]
+            prev_start = hms_to_seconds(prev.get("StartTime"))
+            prev_end = hms_to_seconds(prev.get("EndTime"))
+            start = hms_to_seconds(event.get("StartTime"))
+            end = hms_to_seconds(event.get("EndTime"))
+            if None not in (prev_start, prev_end, start, end):
+                same_activity = (
+                    prev.get("ActivityName") == event.get("ActivityName")
+                    and sorted(prev.get("ToolsUsed") or []) == sorted(event.get("ToolsUsed") or [])
+                )
+                if same_activity and start <= prev_end + get_settings().frame_interval_sec:
+                    new_end = max(prev_end, end)
+                    prev["EndTime"] = hms(new_end)
+                    prev["DurationMin"] = _format_minutes(new_end - prev_start)
+                    if isinstance(prev.get("SwitchCount"), int) and isinstance(event.get("SwitchCount"), int):
+                        prev["SwitchCount"] += event["SwitchCount"]
+                    prev_order = order
+                    continue
+                if start < prev_end:
+                    prev["EndTime"] = hms(start)
+                    prev["DurationMin"] = _format_minutes(max(0, start - prev_start))
+        merged.append(event)
+        prev_order = order
+
+    for idx, event in enumerate(merged, start=1):
+        event["StageSequenceID"] = idx
+    return merged
+
+
+def window_key(start: int, end: int) -> str:
+    return f"{start}-{end}"
+
+
+def _analyze_in_windows(
+    filename: str,
+    duration_hms: str,
+    timed_lines: List[Tuple[int, str]],
+    employee_id: str,
+    fullname: str,
+    team: str,
+    date: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    stored_windows: Optional[Dict[str, List[Dict]]] = None,
+    on_window: Optional[Callable[[str, List[Dict]], None]] = None,
+) -> Dict:
+    # Map step: one event-synthesis call per overlapping window, in parallel. Windows found in
+    # stored_windows are not asked again, and each complete window is handed to on_window.
+    # A window that still fails after the scheduler's retries leaves a gap: the other windows
+    # are merged as usual and the result is marked incomplete, so a rerun redoes only the gap.
+    # on_event only sees the events a window owns, so overlap duplicates never reach the live
+    # log; their StageSequenceIDs are per window until the merged list replaces them.
+    s = get_settings()
+    duration_sec = hms_to_seconds(duration_hms) or (timed_lines[-1][0] if timed_lines else 0)
+    windows = event_windows(duration_sec, s.event_window_sec, s.event_window_overlap_sec)
+
+    stored_windows = stored_windows or {}
+
+    def run(window: Tuple[int, int, int, int]) -> Tuple[List[Dict], Optional[str]]:
+        # (events, reason the window is incomplete or None)
+        start, end, _, _ = window
+        key = window_key(start, end)
+
+        def owned_event(event: Dict) -> None:
+            if _owned_by(window, event):
+                on_event(event)
+
+        if key in stored_windows:
+            if on_event is not None:
+                for event in stored_windows[key]:
+                    if isinstance(event, dict):
+                        owned_event(event)
+            return stored_windows[key], None
+        lines = [line for ts, line in timed_lines if start <= ts <= end]
+        if not lines:
+            return [], None
+        note = (
+            f"(This transcript covers {hms(start)} to {hms(end)} of a {duration_hms} recording; "
+            f"use these absolute timestamps for StartTime and EndTime.)"
+        )
+        prompt = build_instruction(
+            filename=filename,
+            duration_hms=hms(end - start),
+            transcript_block=note + "\n" + "\n".join(lines),
+            employee_id=employee_id,
+            fullname=fullname,
+            team=team,
+            date=date,
+        )
+        try:
+            doc = _synthesize_events(prompt, owned_event if on_event is not None else None)
+        except Exception as ex:
+            logger.warning(f"Event synthesis failed for {filename} window {hms(start)}-{hms(end)}: {ex}")
+            count(OPENAI_FALLBACKS, kind="events_window")
+            return [], str(ex)
+        events = doc.get("events", []) if isinstance(doc, dict) else []
+        events = events if isinstance(events, list) else []
+        if isinstance(doc, dict) and not doc.get("complete", True):
+            return events, "event stream ended early"
+        if on_window is not None:
+            try:
+                on_window(key, events)
+            except Exception as ex:
+                logger.warning(f"Could not store window {key} of {filename}: {ex}")
+        return events, None
+
+    workers = max(1, min(s.event_window_concurrency, len(windows)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="events") as pool:
+        results = list(pool.map(bind(run), windows))
+    gaps = [
+        {"start": hms(start), "end": hms(end), "reason": reason}
+        for (start, end, _, _), (_, reason) in zip(windows, results)
+        if reason is not None
+    ]
+    if len(gaps) == len(windows):
+        raise RuntimeError(f"Event synthesis failed for every window: {gaps[0]['reason']}")
+    events = merge_window_events([(window, events) for window, (events, _) in zip(windows, results)])
+    logger.info(
+        f"Synthesized {len(events)} events for {filename} from {len(windows)} windows"
+        + (f", {len(gaps)} incomplete" if gaps else "")
+    )
+    doc = _empty_events_doc(filename, employee_id, fullname, team, date)
+    doc["events"] = events
+    if gaps:
+        doc["complete"] = False
+        doc["gaps"] = gaps
+    return doc
+
+
 def analyze_video_frames_to_events(
     filename: str,
     duration_hms: str,
-    frames: List[Tuple[str, int]],
+    frames: List[Tuple[FrameSource, int]],
     employee_id: str,
     fullname: str,
     team: str,
     date: str,
+    reuse: Optional[Dict[int, int]] = None,
+    described: Optional[Dict[int, str]] = None,
+    on_described: Optional[Callable[[Dict[int, str]], None]] = None,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    stored_windows: Optional[Dict[str, List[Dict]]] = None,
+    on_window: Optional[Callable[[str, List[Dict]], None]] = None,
 ) -> Dict:
-    lines: List[str] = []
-    for fp, ts in frames:
-        desc = analyze_frame(fp, ts)
-        lines.append(f"[{hms(ts)}] {desc}")
-    transcript_block = "\n".join(lines)
+    # on_event switches event synthesis to streaming and receives each validated event.
+    with stage_timer("analyze_video"):
+        with stage_timer("describe_frames"):
+            descriptions = describe_frames(frames, reuse, described, on_described)
+        transcript = [(ts, desc) for (_, ts), desc in zip(frames, descriptions)]
+        return _events_from_transcript(
+            filename, duration_hms, transcript, employee_id, fullname, team, date, on_event, stored_windows, on_window
+        )
+
 
+def events_from_transcript(
+    filename: str,
+    duration_hms: str,
+    transcript: List[Tuple[int, str]],
+    employee_id: str,
+    fullname: str,
+    team: str,
+    date: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    stored_windows: Optional[Dict[str, List[Dict]]] = None,
+    on_window: Optional[Callable[[str, List[Dict]], None]] = None,
+) -> Dict:
+    # Event synthesis alone, for a video whose frame descriptions are already known.
+    with stage_timer("analyze_video"):
+        return _events_from_transcript(
+            filename, duration_hms, transcript, employee_id, fullname, team, date, on_event, stored_windows, on_window
+        )
+
+
+def _events_from_transcript(
+    filename: str,
+    duration_hms: str,
+    transcript: List[Tuple[int, str]],
+    employee_id: str,
+    fullname: str,
+    team: str,
+    date: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    stored_windows: Optional[Dict[str, List[Dict]]] = None,
+    on_window: Optional[Callable[[str, List[Dict]], None]] = None,
+) -> Dict:
+    timed_lines = [(ts, f"[{hms(ts)}] {desc}") for ts, desc in transcript]
+
+    s = get_settings()
+    duration_sec = hms_to_seconds(duration_hms) or 0
+    if s.event_window_sec > 0 and duration_sec > s.event_window_sec:
+        return _analyze_in_windows(
+            filename, duration_hms, timed_lines, employee_id, fullname, team, date, on_event, stored_windows, on_window
+        )
+
+    transcript_block = "\n".join(line for _, line in timed_lines)
     prompt = build_instruction(
         filename=filename,
         duration_hms=duration_hms,
@@ -196,37 +875,7 @@ def analyze_video_frames_to_events(
         date=date,
     )
 
-    s = get_settings()
-    try:
-        cl = _get_client()
-        completion = cl.chat.completions.create(
-            model=s.openai_model,
-            messages=[
-                {"role": "system", "content": "You output only valid JSON."},
-                {"role": "user", "content": prompt},
-            ],
-        )
-        text = (completion.choices[0].message.content or "{}").strip()
-        if not text:
-            logger.warning("Video frame description is empty; vision haved no response")
-            return {
-                "filename": filename,
-                "caseid": f"{employee_id}_{date}",
-                "employeeid": employee_id,
-                "fullname": fullname,
-                "team": team,
-                "date": date,
-                "events": [],
-            }
-        return coerce_json(text)
-    except Exception as ex:
-        logger.exception(f"analyze_video_frames_to_events failed: {ex}")
-        return {
-            "filename": filename,
-            "caseid": f"{employee_id}_{date}",
-            "employeeid": employee_id,
-            "fullname": fullname,
-            "team": team,
-            "date": date,
-            "events": [],
-        }
+    doc = _synthesize_events(prompt, on_event)
+    if not isinstance(doc, dict):
+        raise ValueError(f"Event synthesis returned {type(doc).__name__}, expected an object")
+    return doc or _empty_events_doc(filename, employee_id, fullname, team, date)
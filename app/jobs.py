@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import get_settings
+from .db_utils import append_job_event, create_job, touch_jobs, unmark_processed, update_job
+from .s3_utils import invalidate_listing_cache, list_videos_for_employee_date
+from .worker import process_employee_dates
+from .metrics import merge_snapshots
+
+logger = logging.getLogger("video-analysis.jobs")
+
+FINISHED_STATUSES = {"done", "failed"}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Jobs queued or running in this process; their updatedAt is refreshed by the heartbeat so
+# other processes (and restarts of this one) can tell live jobs from orphaned ones.
+_active: Set[str] = set()
+_active_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, get_settings().job_workers), thread_name_prefix="job")
+    return _executor
+
+
+def _heartbeat_forever() -> None:
+    while True:
+        time.sleep(max(1, get_settings().job_heartbeat_sec))
+        with _active_lock:
+            ids = list(_active)
+        try:
+            touch_jobs(ids)
+        except Exception as ex:
+            logger.warning(f"Job heartbeat failed for {len(ids)} jobs: {ex}")
+
+
+def _track(job_id: str) -> None:
+    global _heartbeat
+    with _active_lock:
+        _active.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_forever, name="job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _untrack(job_id: str) -> None:
+    with _active_lock:
+        _active.discard(job_id)
+
+
+class JobProgress:
+    # Module-level and picklable so it also works from process-pool workers.
+
+    def __init__(self, job_id: str, employee_id: str, date: str):
+        self.job_id = job_id
+        self.employee_id = employee_id
+        self.date = date
+
+    def __call__(self, event: Dict) -> None:
+        append_job_event(self.job_id, {"employeeID": self.employee_id, "date": self.date, **event})
+
+
+def summarize_results(pairs: List[Tuple[str, str]], results: List[Dict]) -> Dict:
+    total_processed = 0
+    all_skipped = []
+    all_errors = []
+    detail = []
+    for (emp, dt), res in zip(pairs, results):
+        total_processed += res.get("processedCount", 0)
+        all_skipped.extend([f"{emp}:{dt}:{f}" for f in res.get("skipped", [])])
+        all_errors.extend([f"{emp}:{dt}:{err}" for err in res.get("errors", [])])
+        detail.append({"employeeID": emp, "date": dt, **res})
+    return {
+        "processedCount": total_processed,
+        "skipped": all_skipped,
+        "errors": all_errors,
+        "detail": detail,
+        "metrics": merge_snapshots([res.get("metrics") for res in results]),
+    }
+
+
+def run_pairs(kind: str, pairs: List[Tuple[str, str]], job_id: Optional[str] = None) -> Dict:
+    force = kind == "reprocess"
+    # Start every run from a fresh listing; later lookups in the same run hit the cache.
+    for emp, dt in pairs:
+        invalidate_listing_cache(emp, dt)
+    if force:
+        for emp, dt in pairs:
+            for v in list_videos_for_employee_date(emp, dt):
+                unmark_processed(emp, v["file_name"])
+    progress_for = (lambda emp, dt: JobProgress(job_id, emp, dt)) if job_id else None
+    results = process_employee_dates(pairs, force=force, progress_for=progress_for)
+    return summarize_results(pairs, results)
+
+
+def _run_job(job_id: str, kind: str, pairs: List[Tuple[str, str]]) -> None:
+    try:
+        update_job(job_id, {"status": "running"})
+        logger.info(f"Job {job_id} started kind={kind} pairs={len(pairs)}")
+        try:
+            summary = run_pairs(kind, pairs, job_id=job_id)
+        except Exception as ex:
+            logger.exception(f"Job {job_id} failed: {ex}")
+            update_job(job_id, {"status": "failed", "error": str(ex)})
+            return
+        update_job(job_id, {"status": "done", "result": summary})
+    finally:
+        _untrack(job_id)
+    logger.info(
+        f"Job {job_id} done processed={summary['processedCount']} skipped={len(summary['skipped'])} errors={len(summary['errors'])}"
+    )
+
+
+def submit_job(kind: str, employees: List[str], dates: List[str]) -> str:
+    job_id = uuid.uuid4().hex
+    create_job(job_id, kind, employees, dates)
+    _track(job_id)
+    pairs = [(emp, dt) for emp in employees for dt in dates]
+    _get_executor().submit(_run_job, job_id, kind, pairs)
+    logger.info(f"Job {job_id} queued kind={kind} employees={employees} dates={dates}")
+    return job_id
@@ -1,14 +1,26 @@
 import argparse
+import asyncio
+import json
 import logging
+import threading
 import time
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from . import aio
 
 from .models import StatusResponse
-from .worker import process_employee_date
-from .s3_utils import list_videos_for_employee_date
-from .db_utils import get_status, unmark_processed
+from .worker import process_employee_dates
+from .jobs import FINISHED_STATUSES, run_pairs, submit_job
+from .employees import resolve_employee_ids
+from .db_utils import backfill_processed_dates, ensure_indexes, fail_stale_jobs
 from .config import get_settings
+from .metrics import render_prometheus
+from .rollups import backfill_rollups, employee_day_rollups, team_day_rollups
+from .video_processor import sweep_orphan_scratch
 
 settings = get_settings()
 
@@ -21,6 +33,56 @@ logger = logging.getLogger("video-analysis")
 app = FastAPI(title="Video Analysis")
 
 
+@app.on_event("startup")
+def create_indexes():
+    try:
+        ensure_indexes()
+    except Exception as ex:
+        logger.warning(f"Could not ensure Mongo indexes at startup: {ex}")
+
+
+@app.on_event("startup")
+def fail_orphaned_jobs():
+    # Jobs left queued or running by a process that died are failed here; ones owned by a
+    # live replica keep their heartbeat fresh and are left alone.
+    try:
+        fail_stale_jobs(settings.job_stale_sec)
+    except Exception as ex:
+        logger.warning(f"Could not check for stale jobs at startup: {ex}")
+
+
+def _backfill_processed_dates():
+    try:
+        backfill_processed_dates()
+    except Exception as ex:
+        logger.warning(f"Processed-date backfill failed; it is retried on the next start: {ex}")
+
+
+@app.on_event("startup")
+def start_processed_dates_backfill():
+    # Runs once per deployment in the background; status falls back to file names meanwhile.
+    threading.Thread(target=_backfill_processed_dates, name="processed-dates", daemon=True).start()
+
+
+def _sweep_scratch_forever():
+    while True:
+        try:
+            sweep_orphan_scratch(settings.scratch_root, settings.scratch_max_age_sec)
+        except Exception as ex:
+            logger.warning(f"Scratch sweep failed: {ex}")
+        time.sleep(max(60, settings.scratch_sweep_interval_sec))
+
+
+@app.on_event("startup")
+def start_scratch_sweeper():
+    threading.Thread(target=_sweep_scratch_forever, name="scratch-sweeper", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    await aio.close_clients()
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start = time.time()
@@ -36,53 +98,134 @@ async def log_requests(request: Request, call_next):
         return JSONResponse(status_code=500, content={"error": str(exc)})
 
 
+def _split_csv(value: str):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def _job_links(job_id: str) -> dict:
+    return {
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/jobs/{job_id}",
+        "eventsUrl": f"/jobs/{job_id}/events",
+    }
+
+
+# Handlers are async: Mongo and S3 reads go through app.aio, and the blocking analysis of
+# ?wait=true runs on starlette's threadpool, so long runs never starve /status.
+
+
 @app.get("/process/{employee_id}/{date}")
-def process_endpoint(employee_id: str, date: str):
-    logger.info(f"/process start employees={employee_id} dates={date}")
-    employees = [e.strip() for e in employee_id.split(",") if e.strip()]
-    dates = [d.strip() for d in date.split(",") if d.strip()]
-    total_processed = 0
-    all_skipped = []
-    all_errors = []
-    detail = []
-    for emp in employees:
-        for dt in dates:
-            logger.info(f"Processing emp={emp} date={dt}")
-            res = process_employee_date(emp, dt, force=False)
-            total_processed += res.get("processedCount", 0)
-            all_skipped.extend([f"{emp}:{dt}:{f}" for f in res.get("skipped", [])])
-            all_errors.extend([f"{emp}:{dt}:{err}" for err in res.get("errors", [])])
-            detail.append({"employeeID": emp, "date": dt, **res})
+async def process_endpoint(employee_id: str, date: str, wait: bool = False):
+    logger.info(f"/process start employees={employee_id} dates={date} wait={wait}")
+    employees = await aio.run_blocking(resolve_employee_ids, _split_csv(employee_id))
+    dates = _split_csv(date)
+    if not wait:
+        job_id = await aio.run_blocking(submit_job, "process", employees, dates)
+        return JSONResponse(status_code=202, content=_job_links(job_id))
+    pairs = [(emp, dt) for emp in employees for dt in dates]
+    summary = await run_in_threadpool(run_pairs, "process", pairs)
     logger.info(
-        f"/process done employees={len(employees)} dates={len(dates)} processed={total_processed} skipped={len(all_skipped)} errors={len(all_errors)}"
+        f"/process done employees={len(employees)} dates={len(dates)} processed={summary['processedCount']} skipped={len(summary['skipped'])} errors={len(summary['errors'])}"
     )
-    return {
-        "message": "Processing finished",
-        "processedCount": total_processed,
-        "skipped": all_skipped,
-        "errors": all_errors,
-        "detail": detail,
-    }
+    return {"message": "Processing finished", **summary}
 
 
 @app.get("/status/{employee_id}/{date}", response_model=StatusResponse)
-def status_endpoint(employee_id: str, date: str):
+async def status_endpoint(employee_id: str, date: str):
     logger.info(f"/status employees={employee_id} date={date}")
-    vids = list_videos_for_employee_date(employee_id, date)
-    s3_list = [v["file_name"] for v in vids]
-    return get_status(employee_id, date, s3_list)
+    listings = await aio.status_listings([(employee_id, date)])
+    return (await aio.statuses(listings))[0]
+
+
+@app.get("/status-batch/{employee_ids}/{dates}")
+async def status_batch_endpoint(employee_ids: str, dates: str):
+    # Every (employee, date) pair in one response; processed state comes from a single query.
+    logger.info(f"/status-batch employees={employee_ids} dates={dates}")
+    employees = await aio.run_blocking(resolve_employee_ids, _split_csv(employee_ids))
+    pairs = [(emp, dt) for emp in employees for dt in _split_csv(dates)]
+    return {"statuses": await aio.statuses(await aio.status_listings(pairs))}
 
 
 @app.post("/reprocess/{employee_id}/{date}")
-def reprocess_endpoint(employee_id: str, date: str):
-    logger.info(f"/reprocess employees={employee_id} date={date}")
-    vids = list_videos_for_employee_date(employee_id, date)
-    for v in vids:
-        unmark_processed(employee_id, v["file_name"])
-    result = process_employee_date(employee_id, date, force=True)
+async def reprocess_endpoint(employee_id: str, date: str, wait: bool = False):
+    logger.info(f"/reprocess employees={employee_id} date={date} wait={wait}")
+    employees = await aio.run_blocking(resolve_employee_ids, _split_csv(employee_id))
+    dates = _split_csv(date)
+    if not wait:
+        job_id = await aio.run_blocking(submit_job, "reprocess", employees, dates)
+        return JSONResponse(status_code=202, content=_job_links(job_id))
+    result = await run_in_threadpool(run_pairs, "reprocess", [(emp, dt) for emp in employees for dt in dates])
     return {"message": "Reprocessing finished", "count": result.get("processedCount", 0)}
 
 
+async def _current_job(job_id: str, events_from: int = 0):
+    # The job document, with an unfinished job whose heartbeat stopped marked failed first.
+    job = await aio.job(job_id, events_from)
+    if job is None or job.get("status") in FINISHED_STATUSES:
+        return job
+    updated = job.get("updatedAt")
+    if isinstance(updated, datetime) and datetime.utcnow() - updated > timedelta(seconds=settings.job_stale_sec):
+        if await aio.run_blocking(fail_stale_jobs, settings.job_stale_sec, job_id):
+            job = await aio.job(job_id, events_from)
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_endpoint(job_id: str):
+    job = await _current_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(content=json.loads(json.dumps(job, default=str)))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    if await aio.job(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def stream():
+        # Server-sent events: one "progress" event per process_employee_date step,
+        # then a final "end" event carrying the job result.
+        seen = 0
+        while True:
+            job = await _current_job(job_id, events_from=seen)
+            if job is None:
+                return
+            for event in job.get("events", []):
+                seen += 1
+                yield f"event: progress\ndata: {json.dumps(event, default=str)}\n\n"
+            if job.get("status") in FINISHED_STATUSES:
+                payload = {"status": job["status"], "result": job.get("result"), "error": job.get("error")}
+                yield f"event: end\ndata: {json.dumps(payload, default=str)}\n\n"
+                return
+            await asyncio.sleep(settings.job_events_poll_sec)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/analytics/employees/{employee_ids}/{dates}")
+async def employee_analytics_endpoint(employee_ids: str, dates: str):
+    employees = await aio.run_blocking(resolve_employee_ids, _split_csv(employee_ids))
+    return {"rollups": await aio.run_blocking(employee_day_rollups, employees, _split_csv(dates))}
+
+
+@app.get("/analytics/teams/{teams}/{dates}")
+async def team_analytics_endpoint(teams: str, dates: str):
+    return {"rollups": await aio.run_blocking(team_day_rollups, _split_csv(teams), _split_csv(dates))}
+
+
+@app.post("/analytics/backfill")
+async def analytics_backfill_endpoint(employee_id: Optional[str] = None, date: Optional[str] = None):
+    logger.info(f"/analytics/backfill employee={employee_id} date={date}")
+    return {"replayed": await run_in_threadpool(backfill_rollups, employee_id, date)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 # CLI passthrough when running under uvicorn with -- --employee ... --date ...
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument("--employee", dest="employee_id", default=None)
@@ -96,6 +239,4 @@ if args.employee_id and args.date:
     @app.on_event("startup")
     def trigger_cli_processing():
         logger.info(f"Startup CLI processing employees={emp_list} dates={date_list}")
-        for emp in emp_list:
-            for dt in date_list:
-                process_employee_date(emp, dt, force=False)
+        process_employee_dates([(emp, dt) for emp in emp_list for dt in date_list], force=False)
@@ -0,0 +1,197 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Minimal Prometheus text-format metrics. Values are per process: with
+# PROCESS_EXECUTOR=process, /metrics only shows the API process, while per-job
+# summaries still carry the numbers collected in the worker processes.
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            # bucket counts (non-cumulative), then sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for i, bound in enumerate(self.buckets):
+                    cumulative += series[i]
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("video_analysis_stage_seconds", "Wall time per pipeline stage.")
+OPENAI_TOKENS = Counter("video_analysis_openai_tokens_total", "OpenAI tokens by call kind and token type.")
+OPENAI_RETRIES = Counter("video_analysis_openai_retries_total", "Retried OpenAI calls by call kind.")
+OPENAI_FALLBACKS = Counter("video_analysis_openai_fallbacks_total", "OpenAI calls that gave up and used fallback output.")
+FRAMES = Counter("video_analysis_frames_total", "Frames by outcome (extracted, deduped, cached, described).")
+BYTES = Counter("video_analysis_bytes_total", "Bytes moved by kind (downloaded, frames).")
+VIDEOS = Counter("video_analysis_videos_total", "Videos by outcome (processed, skipped, failed).")
+
+REGISTRY = [STAGE_SECONDS, OPENAI_TOKENS, OPENAI_RETRIES, OPENAI_FALLBACKS, FRAMES, BYTES, VIDEOS]
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class JobMetrics:
+    # Per-job tally mirrored from the global metrics while a job scope is active.
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+    def inc(self, name: str, amount: float) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "stages": {k: {"count": v["count"], "seconds": round(v["seconds"], 3)} for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+def merge_snapshots(snapshots: List[Dict]) -> Dict:
+    merged = JobMetrics()
+    for snap in snapshots:
+        for stage, entry in (snap or {}).get("stages", {}).items():
+            with merged._lock:
+                target = merged.stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+                target["count"] += entry.get("count", 0)
+                target["seconds"] += entry.get("seconds", 0.0)
+        for name, value in (snap or {}).get("counters", {}).items():
+            merged.inc(name, value)
+    return merged.snapshot()
+
+
+_scope: contextvars.ContextVar[Optional[JobMetrics]] = contextvars.ContextVar("job_metrics", default=None)
+
+
+@contextmanager
+def job_scope() -> Iterator[JobMetrics]:
+    scope = JobMetrics()
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def bind(fn: Callable) -> Callable:
+    # Carries the caller's job scope into pool threads, which start with an empty context.
+    scope = _scope.get()
+
+    def wrapper(*args, **kwargs):
+        token = _scope.set(scope)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _scope.reset(token)
+
+    return wrapper
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    scope = _scope.get()
+    if scope is not None:
+        scope.observe(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def count(counter: Counter, amount: float = 1.0, **labels) -> None:
+    if not amount:
+        return
+    counter.inc(amount, **labels)
+    scope = _scope.get()
+    if scope is not None:
+        suffix = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+        scope.inc(f"{counter.name}{{{suffix}}}" if suffix else counter.name, amount)
+
+
+def record_openai_usage(completion, kind: str) -> None:
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    count(OPENAI_TOKENS, getattr(usage, "prompt_tokens", 0) or 0, kind=kind, type="prompt")
+    count(OPENAI_TOKENS, getattr(usage, "completion_tokens", 0) or 0, kind=kind, type="completion")
@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from .config import get_settings
+from .metrics import OPENAI_RETRIES, count, observe_stage
+
+logger = logging.getLogger("video-analysis.openai")
+
+# Lower runs first: a waiting event-synthesis call goes ahead of queued frame calls.
+PRIORITY = {"events": 0, "vision": 1}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    # x-ratelimit-reset-* values look like "20ms", "1s" or "6m0s".
+    if not value:
+        return None
+    parts = DURATION_PART_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    if headers is None:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    after = _parse_duration(headers.get("retry-after"))
+    if after is not None:
+        return after
+    resets = [
+        _parse_duration(headers.get("x-ratelimit-reset-requests")),
+        _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def share_of_limit(limit: int, shares: int) -> int:
+    # 0 (unlimited) stays unlimited; otherwise round down so the shares never add up to more.
+    if limit <= 0:
+        return limit
+    return max(1, limit // max(1, shares))
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _Bucket:
+    # Token bucket refilled continuously over a minute; capacity 0 means unlimited.
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self._stamp) * self.capacity / 60.0)
+        self._stamp = now
+
+    def wait_for(self, amount: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+    def resize(self, per_minute: int) -> None:
+        if per_minute <= 0 or per_minute == self.capacity:
+            return
+        self.level = min(self.level, float(per_minute)) if self.capacity > 0 else float(per_minute)
+        self.capacity = float(per_minute)
+
+
+class OpenAIScheduler:
+    # One per process. Calls queue by priority, wait for room in the request and token buckets,
+    # and on a 429 pause the whole queue for the server's retry-after before retrying.
+
+    def __init__(
+        self, rpm: int, tpm: int, max_retries: int, backoff_base: float, backoff_max: float, shares: int = 1
+    ):
+        self.shares = max(1, shares)
+        rpm, tpm = share_of_limit(rpm, self.shares), share_of_limit(tpm, self.shares)
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._configured = (rpm, tpm)
+        self._paused_until = 0.0
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _acquire(self, priority: int, tokens: int) -> None:
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == entry:
+                        self.requests.refill(now)
+                        self.tokens.refill(now)
+                        wait = max(
+                            self._paused_until - now,
+                            self.requests.wait_for(1),
+                            self.tokens.wait_for(tokens),
+                        )
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            heapq.heappop(self._waiters)
+                            self._cond.notify_all()
+                            return
+                        self._cond.wait(timeout=min(wait, 1.0))
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def settle(self, reserved: int, used: int) -> None:
+        # Charges (or refunds) the difference between the up-front estimate and real usage.
+        if not used:
+            return
+        with self._cond:
+            self.tokens.level -= used - reserved
+            self._cond.notify_all()
+
+    def _pause(self, seconds: float) -> None:
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def _observe_headers(self, headers) -> None:
+        # Follow the server's view of our limits: adopt the account limits unless configured
+        # lower, and never believe we have more room than the server says is left.
+        if headers is None:
+            return
+        with self._cond:
+            for bucket, configured, suffix in (
+                (self.requests, self._configured[0], "requests"),
+                (self.tokens, self._configured[1], "tokens"),
+            ):
+                limit = _header_int(headers, f"x-ratelimit-limit-{suffix}")
+                if limit:
+                    limit = share_of_limit(limit, self.shares)
+                    bucket.resize(min(limit, configured) if configured > 0 else limit)
+                remaining = _header_int(headers, f"x-ratelimit-remaining-{suffix}")
+                if remaining is not None and bucket.capacity > 0:
+                    bucket.level = min(bucket.level, float(remaining))
+
+    def _backoff(self, attempt: int, headers) -> float:
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay *= 0.5 + random.random() / 2
+        return min(self.backoff_max, max(0.0, delay))
+
+    def run(self, kind: str, estimated_tokens: int, call: Callable[[], object]):
+        # `call` makes one request through the client's with_raw_response interface; the
+        # parsed result is returned. Non-retryable errors and the last failure are raised.
+        priority = PRIORITY.get(kind, len(PRIORITY))
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            self._acquire(priority, estimated_tokens)
+            observe_stage(f"openai_wait_{kind}", time.perf_counter() - started)
+            try:
+                raw = call()
+            except (APITimeoutError, APIConnectionError) as ex:
+                headers, reason = None, "timeout" if isinstance(ex, APITimeoutError) else "connection"
+                error = ex
+            except APIStatusError as ex:
+                if ex.status_code not in RETRYABLE_STATUS:
+                    raise
+                headers, reason, error = ex.response.headers, str(ex.status_code), ex
+            else:
+                self._observe_headers(raw.headers)
+                return raw.parse()
+
+            if attempt >= self.max_retries:
+                logger.warning(f"OpenAI {kind} call failed after {attempt + 1} attempts: {error}")
+                raise error
+            delay = self._backoff(attempt, headers)
+            count(OPENAI_RETRIES, kind=kind, reason=reason)
+            logger.info(f"OpenAI {kind} call got {reason}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            if reason == "429":
+                self._observe_headers(headers)
+                self._pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "queued": len(self._waiters),
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "pausedForSec": max(0.0, round(self._paused_until - time.monotonic(), 2)),
+            }
+
+
+_scheduler: Optional[OpenAIScheduler] = None
+_scheduler_lock = threading.Lock()
+# Processes sharing the account limits; each process has its own scheduler, so with
+# PROCESS_EXECUTOR=process every worker gets 1/shares of the configured or learned limits.
+_shares = 1
+
+
+def set_process_shares(shares: int) -> None:
+    # Called in process-pool workers before any OpenAI call.
+    global _shares
+    with _scheduler_lock:
+        _shares = max(1, shares)
+
+
+def get_scheduler() -> OpenAIScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                s = get_settings()
+                _scheduler = OpenAIScheduler(
+                    s.openai_rpm_limit,
+                    s.openai_tpm_limit,
+                    s.openai_max_retries,
+                    s.openai_backoff_base_sec,
+                    s.openai_backoff_max_sec,
+                    _shares,
+                )
+    return _scheduler
@@ -0,0 +1,229 @@
+import logging
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+from .db_utils import employee_rollups_col, logs_col, rollup_sources_col, team_rollups_col
+from .metrics import stage_timer
+from .video_processor import hms_to_seconds
+
+logger = logging.getLogger("video-analysis.rollups")
+
+# Per employee-day and team-day totals kept up to date as event logs are saved, so
+# dashboards read one small document instead of unwinding every event. Each saved log's
+# contribution is remembered per (employeeID, fileName); saving the same file again
+# (reprocess) applies only the difference, so totals never double count.
+
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+MAP_FIELDS = ("activityMinutes", "aiOpportunityEvents", "valueTypeMinutes")
+
+
+def _event_minutes(event: Dict) -> float:
+    match = NUMBER_RE.search(str(event.get("DurationMin", "")))
+    if match:
+        return max(0.0, float(match.group()))
+    start, end = hms_to_seconds(event.get("StartTime")), hms_to_seconds(event.get("EndTime"))
+    if start is None or end is None or end < start:
+        return 0.0
+    return (end - start) / 60.0
+
+
+def _key(value) -> str:
+    # Map keys become field paths, so "." and a leading "$" are not allowed.
+    text = str(value or "Unknown").strip() or "Unknown"
+    return text.replace(".", "_").lstrip("$") or "Unknown"
+
+
+def contribution(events: List[Dict]) -> Dict:
+    totals: Dict = {
+        "videos": 1,
+        "events": 0,
+        "minutes": 0.0,
+        "idleMinutes": 0.0,
+        "reworkEvents": 0,
+        "activityMinutes": {},
+        "aiOpportunityEvents": {},
+        "valueTypeMinutes": {},
+    }
+    for event in events or []:
+        if not isinstance(event, dict):
+            continue
+        minutes = _event_minutes(event)
+        totals["events"] += 1
+        totals["minutes"] += minutes
+        if str(event.get("IdleTimeFlag", "")).strip().lower() == "yes":
+            totals["idleMinutes"] += minutes
+        if str(event.get("ReworkFlag", "")).strip().lower() == "yes":
+            totals["reworkEvents"] += 1
+        activity = _key(event.get("ActivityName"))
+        totals["activityMinutes"][activity] = totals["activityMinutes"].get(activity, 0.0) + minutes
+        level = _key(event.get("AIOpportunityLevel"))
+        totals["aiOpportunityEvents"][level] = totals["aiOpportunityEvents"].get(level, 0) + 1
+        value = _key(event.get("ValueType"))
+        totals["valueTypeMinutes"][value] = totals["valueTypeMinutes"].get(value, 0.0) + minutes
+    return totals
+
+
+def _increments(new: Optional[Dict], old: Optional[Dict]) -> Dict[str, float]:
+    inc: Dict[str, float] = {}
+
+    def add(values: Optional[Dict], sign: int) -> None:
+        for field, value in (values or {}).items():
+            if field in MAP_FIELDS:
+                for k, v in value.items():
+                    path = f"{field}.{k}"
+                    inc[path] = inc.get(path, 0) + sign * v
+            else:
+                inc[field] = inc.get(field, 0) + sign * value
+
+    add(new, 1)
+    add(old, -1)
+    return {k: v for k, v in inc.items() if v}
+
+
+def _upsert(targets: Dict, target_id: str, identity: Dict, inc: Dict[str, float]) -> None:
+    if not inc:
+        return
+    entry = targets.setdefault(target_id, {"identity": identity, "inc": {}})
+    for path, value in inc.items():
+        entry["inc"][path] = entry["inc"].get(path, 0) + value
+
+
+def record_rollups(documents: Iterable[Dict]) -> None:
+    # Call after the event logs are saved. Failures are logged: the logs themselves are the
+    # source of truth and backfill_rollups() can rebuild the totals from them. The sources are
+    # written only after the increments went through, so a failed write is redone by the next
+    # save or backfill of the file instead of being taken as already counted.
+    documents = list(documents)
+    employee_targets: Dict[str, Dict] = {}
+    team_targets: Dict[str, Dict] = {}
+    try:
+        with stage_timer("rollups"):
+            ids = [f"{doc['employeeID']}:{doc['fileName']}" for doc in documents]
+            sources = {src["_id"]: src for src in rollup_sources_col().find({"_id": {"$in": ids}})}
+            written: Dict[str, Dict] = {}
+            for source_id, doc in zip(ids, documents):
+                new = contribution(doc.get("events", []))
+                source = {
+                    "_id": source_id,
+                    "employeeID": doc["employeeID"],
+                    "fileName": doc["fileName"],
+                    "team": doc.get("team", "Unknown"),
+                    "date": doc.get("date"),
+                    "contribution": new,
+                    "updatedAt": datetime.utcnow(),
+                }
+                previous = sources.get(source_id)
+                sources[source_id] = written[source_id] = source
+                old = previous.get("contribution") if previous else None
+                emp, team, date = doc["employeeID"], source["team"], doc.get("date")
+                lanes = [
+                    (
+                        employee_targets,
+                        f"{emp}:{date}",
+                        {"employeeID": emp, "date": date, "fullName": doc.get("fullName"), "team": team},
+                        f"{previous['employeeID']}:{previous['date']}" if previous else None,
+                        {"employeeID": previous["employeeID"], "date": previous["date"]} if previous else None,
+                    ),
+                    (
+                        team_targets,
+                        f"{team}:{date}",
+                        {"team": team, "date": date},
+                        f"{previous['team']}:{previous['date']}" if previous else None,
+                        {"team": previous["team"], "date": previous["date"]} if previous else None,
+                    ),
+                ]
+                for targets, new_id, new_identity, old_id, old_identity in lanes:
+                    if old_id == new_id:
+                        _upsert(targets, new_id, new_identity, _increments(new, old))
+                        continue
+                    _upsert(targets, new_id, new_identity, _increments(new, None))
+                    if old_id is not None:
+                        # The file moved (team or date changed): take it out of its old rollup.
+                        _upsert(targets, old_id, old_identity, _increments(None, old))
+
+            now = datetime.utcnow()
+            for col, targets in ((employee_rollups_col(), employee_targets), (team_rollups_col(), team_targets)):
+                ops = [
+                    UpdateOne(
+                        {"_id": target_id},
+                        {"$inc": entry["inc"], "$set": dict(entry["identity"], updatedAt=now)},
+                        upsert=True,
+                    )
+                    for target_id, entry in targets.items()
+                    if entry["inc"]
+                ]
+                if ops:
+                    col.bulk_write(ops, ordered=False)
+            if written:
+                rollup_sources_col().bulk_write(
+                    [ReplaceOne({"_id": source_id}, source, upsert=True) for source_id, source in written.items()],
+                    ordered=False,
+                )
+    except Exception as ex:
+        logger.exception(f"Could not update rollups: {ex}")
+
+
+def backfill_rollups(employee_id: Optional[str] = None, date: Optional[str] = None) -> int:
+    # Replays stored event logs oldest first; the latest log per file wins, as on save.
+    query: Dict = {"status": {"$exists": False}}
+    if employee_id:
+        query["employeeID"] = employee_id
+    if date:
+        query["date"] = date
+    replayed = 0
+    batch: List[Dict] = []
+    for doc in logs_col().find(query).sort("processedAt", 1):
+        batch.append(doc)
+        if len(batch) >= 100:
+            record_rollups(batch)
+            replayed += len(batch)
+            batch = []
+    record_rollups(batch)
+    replayed += len(batch)
+    logger.info(f"Backfilled rollups from {replayed} event logs")
+    return replayed
+
+
+def summarize(doc: Dict) -> Dict:
+    # Rollup document plus the ratios dashboards ask for.
+    out = {k: v for k, v in doc.items() if k != "_id"}
+    minutes = doc.get("minutes", 0) or 0
+    events = doc.get("events", 0) or 0
+    out["minutes"] = round(minutes, 2)
+    out["idleMinutes"] = round(doc.get("idleMinutes", 0) or 0, 2)
+    out["idleShare"] = round(out["idleMinutes"] / minutes, 4) if minutes > 0 else 0.0
+    out["reworkRate"] = round((doc.get("reworkEvents", 0) or 0) / events, 4) if events > 0 else 0.0
+    for field in ("activityMinutes", "valueTypeMinutes"):
+        out[field] = {k: round(v, 2) for k, v in sorted((doc.get(field) or {}).items(), key=lambda kv: -kv[1]) if v}
+    out["aiOpportunityEvents"] = {k: v for k, v in (doc.get("aiOpportunityEvents") or {}).items() if v}
+    return out
+
+
+def _date_filter(dates: List[str]):
+    # "2025-09-01..2025-09-30" is an inclusive range; otherwise a list of ISO dates.
+    if len(dates) == 1 and ".." in dates[0]:
+        start, _, end = dates[0].partition("..")
+        cond: Dict = {}
+        if start:
+            cond["$gte"] = start
+        if end:
+            cond["$lte"] = end
+        return cond
+    return {"$in": dates}
+
+
+def employee_day_rollups(employee_ids: List[str], dates: List[str]) -> List[Dict]:
+    cursor = employee_rollups_col().find(
+        {"employeeID": {"$in": employee_ids}, "date": _date_filter(dates)}
+    ).sort([("employeeID", 1), ("date", 1)])
+    return [summarize(doc) for doc in cursor]
+
+
+def team_day_rollups(teams: List[str], dates: List[str]) -> List[Dict]:
+    cursor = team_rollups_col().find({"team": {"$in": teams}, "date": _date_filter(dates)}).sort(
+        [("team", 1), ("date", 1)]
+    )
+    return [summarize(doc) for doc in cursor]
@@ -1,7 +1,9 @@
 import os
 import re
+import time
 import tempfile
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
@@ -13,6 +15,7 @@ except Exception:
     boto3 = None  # type: ignore
 
 from .config import get_settings
+from .metrics import BYTES, count, stage_timer
 
 logger = logging.getLogger("video-analysis.s3")
 
@@ -28,6 +31,13 @@ FILENAME_RE = re.compile(
 )
 
 
+FILENAME_PREFIX = "ScreenRecording_File_"
+
+# (employee_id, date) -> (fetched_at, videos). Guarded by _listing_lock.
+_listing_cache: Dict[Tuple[str, str], Tuple[float, List[Dict]]] = {}
+_listing_lock = threading.Lock()
+
+
 def _client():
     if boto3 is None:
         raise ImportError(
@@ -39,8 +49,9 @@ def _client():
         connect_timeout=settings.s3_connect_timeout,
         read_timeout=settings.s3_read_timeout,
         retries={"max_attempts": 3, "mode": "standard"},
+        s3={"addressing_style": "path"} if settings.s3_endpoint_url else None,
     )
-    return boto3.client("s3", config=cfg)
+    return boto3.client("s3", config=cfg, endpoint_url=settings.s3_endpoint_url or None)
 
 
 def list_employees() -> List[str]:
@@ -77,13 +88,50 @@ def extract_employee_from_filename(file_name: str) -> Optional[str]:
     return emp.lower() if isinstance(emp, str) else None
 
 
-def list_videos_for_employee_date(employee_id: str, date_str: str) -> List[Dict]:
+def invalidate_listing_cache(employee_id: Optional[str] = None, date_str: Optional[str] = None) -> None:
+    with _listing_lock:
+        if employee_id is None:
+            _listing_cache.clear()
+            return
+        for cached_emp, cached_date in list(_listing_cache):
+            if cached_emp == employee_id and (date_str is None or cached_date == date_str):
+                del _listing_cache[(cached_emp, cached_date)]
+
+
+def cached_listing(employee_id: str, date_str: str) -> Optional[List[Dict]]:
+    ttl = get_settings().s3_list_cache_ttl_sec
+    if ttl <= 0:
+        return None
+    with _listing_lock:
+        hit = _listing_cache.get((employee_id, date_str))
+    if hit and time.monotonic() - hit[0] < ttl:
+        logger.info(f"Listing cache hit employee={employee_id} date={date_str} videos={len(hit[1])}")
+        return list(hit[1])
+    return None
+
+
+def _store_listing(employee_id: str, date_str: str, results: List[Dict]) -> None:
+    if get_settings().s3_list_cache_ttl_sec > 0:
+        with _listing_lock:
+            _listing_cache[(employee_id, date_str)] = (time.monotonic(), results)
+
+
+def listing_prefix(employee_id: str, date_str: str) -> str:
     s = get_settings()
-    client = _client()
     base = f"{s.s3_prefix.rstrip('/')}/{employee_id}/"
-    logger.info(f"Listing S3 bucket={s.s3_bucket} prefix={base} date={date_str}")
-    paginator = client.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=s.s3_bucket, Prefix=base)
+    # Recording names embed YYYYMMDD right after the fixed prefix, so a key prefix
+    # narrows the listing to one day instead of paginating the employee's whole history.
+    if s.s3_list_by_date_prefix:
+        try:
+            return base + FILENAME_PREFIX + datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y%m%d")
+        except ValueError:
+            logger.warning(f"Unparseable date {date_str}; listing the full prefix {base}")
+    return base
+
+
+def videos_from_pages(employee_id: str, date_str: str, pages: List[Dict]) -> List[Dict]:
+    # Shared by the blocking and the async listing: list_objects_v2 pages -> sorted videos,
+    # stored in the listing cache.
     results: List[Dict] = []
     for page in pages:
         for obj in page.get("Contents", []):
@@ -105,20 +153,40 @@ def list_videos_for_employee_date(employee_id: str, date_str: str) -> List[Dict]
                     "key": key,
                     "file_name": fname,
                     "timestamp": ts,
+                    "etag": str(obj.get("ETag", "")).strip('"'),
+                    "size": obj.get("Size"),
                 }
             )
     results.sort(key=lambda x: x["timestamp"])
     logger.info(f"Found {len(results)} videos for employee={employee_id} date={date_str}")
-    return results
+    _store_listing(employee_id, date_str, results)
+    return list(results)
+
 
+def list_videos_for_employee_date(employee_id: str, date_str: str) -> List[Dict]:
+    cached = cached_listing(employee_id, date_str)
+    if cached is not None:
+        return cached
 
-def download_to_tmp(key: str) -> str:
+    s = get_settings()
+    client = _client()
+    prefix = listing_prefix(employee_id, date_str)
+    logger.info(f"Listing S3 bucket={s.s3_bucket} prefix={prefix} date={date_str}")
+    paginator = client.get_paginator("list_objects_v2")
+    with stage_timer("s3_list"):
+        pages = list(paginator.paginate(Bucket=s.s3_bucket, Prefix=prefix))
+    return videos_from_pages(employee_id, date_str, pages)
+
+
+def download_to_tmp(key: str, dest_dir: Optional[str] = None) -> str:
     s = get_settings()
     client = _client()
     fname = os.path.basename(key)
-    tmp_path = os.path.join(tempfile.gettempdir(), fname)
+    tmp_path = os.path.join(dest_dir or tempfile.gettempdir(), fname)
     logger.info(f"Downloading s3://{s.s3_bucket}/{key} -> {tmp_path}")
-    client.download_file(s.s3_bucket, key, tmp_path)
+    with stage_timer("s3_download"):
+        client.download_file(s.s3_bucket, key, tmp_path)
+    count(BYTES, os.path.getsize(tmp_path), kind="downloaded")
     return tmp_path
 
 
@@ -130,3 +198,12 @@ def presigned_url(key: str, expires: int = 3600) -> str:
         Params={"Bucket": s.s3_bucket, "Key": key},
         ExpiresIn=expires,
     )
+
+
+def video_source_url(key: str, expires: int = 3600) -> str:
+    # URL ffmpeg can read with HTTP range requests. S3_STREAM_BASE_URL points at any
+    # range-capable file server laid out like the bucket (e.g. a local stand-in for tests).
+    s = get_settings()
+    if s.s3_stream_base_url:
+        return f"{s.s3_stream_base_url.rstrip('/')}/{key}"
+    return presigned_url(key, expires=expires)
@@ -1,17 +1,40 @@
 import os
+import re
+import json
 import math
+import socket
 import tempfile
 import shutil
+import time
 import logging
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
+from urllib.parse import urlparse
 
 import ffmpeg
 
 logger = logging.getLogger("video-analysis.video")
 
+# Input options for http(s) sources: force range-request seeking and survive dropped connections.
+HTTP_INPUT_OPTIONS = {"seekable": 1, "reconnect": 1, "reconnect_delay_max": 5}
+
+
+SHOWINFO_PTS_RE = re.compile(r"Parsed_showinfo.*?pts_time:\s*([0-9.]+)")
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+SCRATCH_PREFIX = "vas-"
+SCRATCH_OWNER_FILE = ".owner"
+
+# A sampled frame: the JPEG on disk, or its bytes when it never touched disk.
+FrameSource = Union[str, bytes]
+
+
+def is_remote(input_path: str) -> bool:
+    return urlparse(input_path).scheme in {"http", "https"}
+
 
 def get_video_duration_seconds(input_path: str) -> float:
-    probe = ffmpeg.probe(input_path)
+    probe = ffmpeg.probe(input_path, **(HTTP_INPUT_OPTIONS if is_remote(input_path) else {}))
     dur = float(probe["format"]["duration"])  # seconds
     return dur
 
@@ -24,47 +47,333 @@ def hms(seconds: float) -> str:
     return f"{h:02d}:{m:02d}:{sec:02d}"
 
 
-def extract_keyframes_every_n_seconds(input_path: str, n: int = 30) -> List[Tuple[str, int]]:
-    duration = get_video_duration_seconds(input_path)
-    video_id = os.path.splitext(os.path.basename(input_path))[0]
-    out_dir = os.path.join(tempfile.gettempdir(), video_id)
+def hms_to_seconds(value) -> Optional[int]:
+    # Inverse of hms(); also accepts "MM:SS" and plain seconds. None when unparseable.
+    try:
+        parts = [int(p) for p in str(value).strip().split(":")]
+    except ValueError:
+        return None
+    if not parts or len(parts) > 3:
+        return None
+    seconds = 0
+    for p in parts:
+        seconds = seconds * 60 + p
+    return seconds
+
+
+def extract_keyframes_every_n_seconds(
+    input_path: str,
+    out_dir: str,
+    n: int = 30,
+    duration: Optional[float] = None,
+    keyframes_only: bool = False,
+) -> List[Tuple[str, int]]:
+    # One decode pass for the whole video: the fps filter emits the frame shown at every
+    # n-th second, instead of one ffmpeg process (and one seek) per timestamp.
+    # round=up keeps sample k at k*n; the default rounding shows the screen ~n/2 later.
+    if duration is None:
+        duration = get_video_duration_seconds(input_path)
     os.makedirs(out_dir, exist_ok=True)
 
     timestamps = list(range(0, int(math.ceil(duration)), n))
     outputs: List[Tuple[str, int]] = []
+    if not timestamps:
+        return outputs
 
-    for ts in timestamps:
+    input_kwargs = {"skip_frame": "nokey"} if keyframes_only else {}
+    pattern = os.path.join(out_dir, "sample_%06d.jpg")
+    started = time.perf_counter()
+    (
+        ffmpeg
+        .input(input_path, **input_kwargs)
+        .output(
+            pattern,
+            vf=f"fps=1/{n}:round=up",
+            vframes=len(timestamps),
+            format='image2',
+            vcodec='mjpeg',
+            loglevel='error',
+        )
+        .overwrite_output()
+        .run()
+    )
+    elapsed = time.perf_counter() - started
+
+    for idx, ts in enumerate(timestamps, start=1):
+        sample_file = pattern % idx
+        if not os.path.exists(sample_file):
+            continue
         out_file = os.path.join(out_dir, f"frame_{ts}.jpg")
-        (
-            ffmpeg
-            .input(input_path, ss=ts)
-            .output(out_file, vframes=1, format='image2', vcodec='mjpeg', loglevel='error')
-            .overwrite_output()
-            .run()
+        os.replace(sample_file, out_file)
+        outputs.append((out_file, ts))
+
+    per_hour = elapsed * 3600.0 / duration if duration > 0 else 0.0
+    logger.info(
+        f"Extracted {len(outputs)} frames from {os.path.basename(input_path)} in {elapsed:.2f}s "
+        f"({per_hour:.1f}s per recorded hour, keyframes_only={keyframes_only})"
+    )
+    return outputs
+
+
+def extract_adaptive_frames(
+    input_path: str,
+    out_dir: str,
+    duration: Optional[float] = None,
+    scene_threshold: float = 0.3,
+    min_interval: int = 5,
+    max_interval: int = 60,
+    budget: int = 240,
+    keyframes_only: bool = False,
+) -> List[Tuple[str, int]]:
+    # One decode pass that places samples where the screen changes. A frame is kept when
+    # it is the first one, when max_interval has passed since the last sample, or when
+    # the scene score crosses scene_threshold and at least min_interval has passed.
+    # showinfo reports the timestamp of every kept frame on stderr.
+    min_interval = max(1, min_interval)  # whole-second timestamps must stay unique
+    if duration is None:
+        duration = get_video_duration_seconds(input_path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    expr = (
+        f"isnan(prev_selected_t)"
+        f"+gte(t-prev_selected_t,{max_interval})"
+        f"+gt(scene,{scene_threshold})*gte(t-prev_selected_t,{min_interval})"
+    )
+    input_kwargs = {"skip_frame": "nokey"} if keyframes_only else {}
+    pattern = os.path.join(out_dir, "sample_%06d.jpg")
+    started = time.perf_counter()
+    _, stderr = (
+        ffmpeg
+        .input(input_path, **input_kwargs)
+        .output(
+            pattern,
+            vf=f"select='{expr}',showinfo",
+            vsync='vfr',
+            format='image2',
+            vcodec='mjpeg',
+            loglevel='info',
         )
+        .overwrite_output()
+        .run(capture_stderr=True)
+    )
+    elapsed = time.perf_counter() - started
+
+    pts = [float(m.group(1)) for m in SHOWINFO_PTS_RE.finditer(stderr.decode("utf-8", errors="replace"))]
+    samples: List[Tuple[str, int]] = []
+    for idx, pts_time in enumerate(pts, start=1):
+        sample_file = pattern % idx
+        if os.path.exists(sample_file):
+            samples.append((sample_file, int(pts_time)))
+
+    # Over budget: keep an evenly spread subset so the whole video stays covered.
+    if budget > 0 and len(samples) > budget:
+        keep = set(round(i * (len(samples) - 1) / max(1, budget - 1)) for i in range(budget))
+        for idx, (sample_file, _) in enumerate(samples):
+            if idx not in keep:
+                os.remove(sample_file)
+        samples = [sample for idx, sample in enumerate(samples) if idx in keep]
+
+    outputs: List[Tuple[str, int]] = []
+    for sample_file, ts in samples:
+        out_file = os.path.join(out_dir, f"frame_{ts}.jpg")
+        os.replace(sample_file, out_file)
+        outputs.append((out_file, ts))
+
+    per_hour = elapsed * 3600.0 / duration if duration > 0 else 0.0
+    logger.info(
+        f"Adaptive sampling kept {len(outputs)} of {len(pts)} candidate frames from {os.path.basename(input_path)} "
+        f"in {elapsed:.2f}s ({per_hour:.1f}s per recorded hour, threshold={scene_threshold}, "
+        f"interval={min_interval}-{max_interval}s, budget={budget})"
+    )
+    return outputs
+
+
+def extract_frames_by_seeking(
+    input_url: str,
+    out_dir: str,
+    n: int = 30,
+    duration: Optional[float] = None,
+    seeks_per_process: int = 10,
+) -> List[Tuple[str, int]]:
+    # Streaming mode: every sampled position is an input-side seek, which ffmpeg turns
+    # into HTTP range requests, so only the bytes around each sample are fetched and
+    # nothing but the output frames ever touches local disk.
+    if duration is None:
+        duration = get_video_duration_seconds(input_url)
+    os.makedirs(out_dir, exist_ok=True)
+
+    timestamps = list(range(0, int(math.ceil(duration)), n))
+    outputs: List[Tuple[str, int]] = []
+    started = time.perf_counter()
+    step = max(1, seeks_per_process)
+    for i in range(0, len(timestamps), step):
+        chunk = timestamps[i : i + step]
+        streams = [
+            ffmpeg
+            .input(input_url, ss=ts, **HTTP_INPUT_OPTIONS)
+            .video
+            .output(os.path.join(out_dir, f"frame_{ts}.jpg"), vframes=1, format='image2', vcodec='mjpeg', loglevel='error')
+            for ts in chunk
+        ]
+        ffmpeg.merge_outputs(*streams).overwrite_output().run()
+    elapsed = time.perf_counter() - started
+
+    for ts in timestamps:
+        out_file = os.path.join(out_dir, f"frame_{ts}.jpg")
         if os.path.exists(out_file):
             outputs.append((out_file, ts))
 
+    per_hour = elapsed * 3600.0 / duration if duration > 0 else 0.0
+    logger.info(
+        f"Extracted {len(outputs)} frames by seeking {os.path.basename(urlparse(input_url).path)} in {elapsed:.2f}s "
+        f"({per_hour:.1f}s per recorded hour)"
+    )
     return outputs
 
 
-def temp_output_dir_for(input_path: str) -> str:
-    video_id = os.path.splitext(os.path.basename(input_path))[0]
-    return os.path.join(tempfile.gettempdir(), video_id)
+def _split_jpegs(buffer: bytearray) -> List[bytes]:
+    # ffmpeg's mjpeg encoder writes plain baseline JPEGs without embedded thumbnails,
+    # so within a frame 0xFFD9 only ever appears as the end-of-image marker.
+    frames: List[bytes] = []
+    while True:
+        start = buffer.find(JPEG_SOI)
+        if start == -1:
+            buffer.clear()
+            return frames
+        end = buffer.find(JPEG_EOI, start + 2)
+        if end == -1:
+            del buffer[:start]
+            return frames
+        frames.append(bytes(buffer[start : end + 2]))
+        del buffer[: end + 2]
+
 
+def extract_frames_to_memory(
+    input_path: str,
+    n: int = 30,
+    duration: Optional[float] = None,
+    keyframes_only: bool = False,
+    max_buffer_bytes: int = 256 * 1024 * 1024,
+    spill_dir: Optional[str] = None,
+) -> List[Tuple[FrameSource, int]]:
+    # Same single decode pass as extract_keyframes_every_n_seconds, but ffmpeg streams the
+    # encoded frames over stdout (image2pipe) and they are kept as bytes. Once
+    # max_buffer_bytes are held, later frames spill to spill_dir so memory stays bounded.
+    if duration is None:
+        duration = get_video_duration_seconds(input_path)
+    timestamps = list(range(0, int(math.ceil(duration)), n))
+    outputs: List[Tuple[FrameSource, int]] = []
+    if not timestamps:
+        return outputs
 
-def cleanup_temp_artifacts(input_path: str) -> None:
+    input_kwargs = dict(HTTP_INPUT_OPTIONS) if is_remote(input_path) else {}
+    if keyframes_only:
+        input_kwargs["skip_frame"] = "nokey"
+    started = time.perf_counter()
+    process = (
+        ffmpeg
+        .input(input_path, **input_kwargs)
+        .output(
+            "pipe:",
+            vf=f"fps=1/{n}:round=up",
+            vframes=len(timestamps),
+            format='image2pipe',
+            vcodec='mjpeg',
+            loglevel='error',
+        )
+        .run_async(pipe_stdout=True)
+    )
+    buffer = bytearray()
+    held = 0
+    spilled = 0
     try:
-        out_dir = temp_output_dir_for(input_path)
-        if os.path.isdir(out_dir):
-            shutil.rmtree(out_dir, ignore_errors=False)
-            logger.info(f"Deleted temp frames directory: {out_dir}")
-    except Exception as ex:
-        logger.warning(f"Failed to delete frames directory for {input_path}: {ex}")
+        while True:
+            chunk = process.stdout.read(1 << 16)
+            if not chunk:
+                break
+            buffer.extend(chunk)
+            for jpeg in _split_jpegs(buffer):
+                if len(outputs) >= len(timestamps):
+                    break
+                ts = timestamps[len(outputs)]
+                if held + len(jpeg) <= max_buffer_bytes or not spill_dir:
+                    held += len(jpeg)
+                    outputs.append((jpeg, ts))
+                    continue
+                os.makedirs(spill_dir, exist_ok=True)
+                out_file = os.path.join(spill_dir, f"frame_{ts}.jpg")
+                with open(out_file, "wb") as f:
+                    f.write(jpeg)
+                spilled += 1
+                outputs.append((out_file, ts))
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, None)
+    elapsed = time.perf_counter() - started
+
+    per_hour = elapsed * 3600.0 / duration if duration > 0 else 0.0
+    logger.info(
+        f"Piped {len(outputs)} frames from {os.path.basename(urlparse(input_path).path)} in {elapsed:.2f}s "
+        f"({per_hour:.1f}s per recorded hour, {held} bytes in memory, {spilled} spilled to disk)"
+    )
+    return outputs
+
+
+def create_scratch_dir(root: str) -> str:
+    # One private directory per video job, so concurrent jobs never share paths. The owner
+    # file lets sweep_orphan_scratch tell live jobs from ones whose process has died.
+    os.makedirs(root, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=SCRATCH_PREFIX, dir=root)
+    with open(os.path.join(path, SCRATCH_OWNER_FILE), "w") as f:
+        json.dump({"pid": os.getpid(), "host": socket.gethostname(), "createdAt": time.time()}, f)
+    return path
 
+
+def remove_scratch_dir(path: str) -> None:
     try:
-        if os.path.exists(input_path):
-            os.remove(input_path)
-            logger.info(f"Deleted temp video file: {input_path}")
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=False)
+            logger.info(f"Deleted scratch directory: {path}")
     except Exception as ex:
-        logger.warning(f"Failed to delete temp video file {input_path}: {ex}")
+        logger.warning(f"Failed to delete scratch directory {path}: {ex}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def sweep_orphan_scratch(root: str, max_age_sec: int) -> int:
+    # Removes scratch directories left behind by crashed jobs: the owning process on this
+    # host is gone, or the directory is older than max_age_sec regardless of owner.
+    if not os.path.isdir(root):
+        return 0
+    host = socket.gethostname()
+    now = time.time()
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not name.startswith(SCRATCH_PREFIX) or not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, SCRATCH_OWNER_FILE)) as f:
+                owner = json.load(f)
+        except Exception:
+            owner = {}
+        created = owner.get("createdAt") or os.path.getmtime(path)
+        dead = owner.get("host") == host and not _pid_alive(int(owner.get("pid", 0) or 0))
+        if dead or now - created > max_age_sec:
+            remove_scratch_dir(path)
+            removed += 1
+    if removed:
+        logger.info(f"Swept {removed} orphaned scratch directories under {root}")
+    return removed
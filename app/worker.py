@@ -1,77 +1,394 @@
-import json
 import os
+import queue
 import logging
-from typing import Dict, List
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from .config import get_settings
-from .db_utils import is_processed, mark_processed, save_event_log
-from .s3_utils import download_to_tmp, list_videos_for_employee_date
-from .video_processor import extract_keyframes_every_n_seconds, get_video_duration_seconds, hms, cleanup_temp_artifacts
-from .gpt_processor import analyze_video_frames_to_events
+from .db_utils import (
+    EventLogBatch,
+    StreamedEventLog,
+    ensure_indexes,
+    processed_file_names,
+    save_incomplete_event_log,
+)
+from .s3_utils import download_to_tmp, list_videos_for_employee_date, video_source_url
+from .video_processor import (
+    create_scratch_dir,
+    extract_adaptive_frames,
+    extract_frames_by_seeking,
+    extract_frames_to_memory,
+    extract_keyframes_every_n_seconds,
+    get_video_duration_seconds,
+    hms,
+    remove_scratch_dir,
+)
+from .gpt_processor import analyze_video_frames_to_events, events_from_transcript, set_vision_inflight_limit
+from .openai_scheduler import set_process_shares
+from .frame_utils import dedupe_frames, preprocess_frames
+from .frame_cache import get_frame_cache
+from .artifacts import load_artifacts
+from .rollups import record_rollups
+from .claims import LeaseKeeper, lease_keeper
+from .employees import get_employee_info
+from .metrics import BYTES, FRAMES, VIDEOS, bind, count, job_scope, observe_stage
 
 logger = logging.getLogger("video-analysis.worker")
 
+_PIPELINE_DONE = object()
+# Videos whose processed markers are re-read with one query before they are claimed.
+_RECHECK_CHUNK = 8
 
-def load_employee_map() -> Dict[str, Dict[str, str]]:
-    base = os.path.dirname(__file__)
-    path = os.path.join(base, "employee_map.json")
-    if not os.path.exists(path):
-        return {}
-
-    with open(path, "r") as f:
-        raw = json.load(f)
-
-    if isinstance(raw, dict):
-        normalized: Dict[str, Dict[str, str]] = {}
-        for k, v in raw.items():
-            if isinstance(v, dict):
-                first = v.get("First Name") or v.get("first_name") or v.get("firstName") or ""
-                last = v.get("Last Name") or v.get("last_name") or v.get("lastName") or ""
-                if not v.get("fullName"):
-                    full = f"{str(first).strip()} {str(last).strip()}".strip()
-                else:
-                    full = str(v.get("fullName", "")).strip()
-                team = v.get("Department") or v.get("Team") or v.get("department") or v.get("team") or v.get("group") or "Unknown"
-                normalized[str(k)] = {"fullName": full or "Unknown", "team": str(team) or "Unknown"}
-        return normalized
-
-    if isinstance(raw, list):
-        mapping: Dict[str, Dict[str, str]] = {}
-        for row in raw:
-            if not isinstance(row, dict):
-                continue
-            emp_id = row.get("Employee ID") or row.get("employee_id") or row.get("id")
-            if not emp_id:
-                continue
-            emp_id = str(emp_id).strip()
-            first = row.get("First Name") or row.get("first_name") or row.get("FirstName") or ""
-            last = row.get("Last Name") or row.get("last_name") or row.get("LastName") or ""
-            first_str = str(first).strip() if first is not None else ""
-            last_str = str(last).strip() if last is not None and str(last) != "0" else ""
-            full = f"{first_str} {last_str}".strip() if last_str else first_str
-            dept = row.get("Department") or row.get("Team") or row.get("department") or row.get("team") or row.get("group") or "Unknown"
-            team = str(dept).strip() if dept is not None else "Unknown"
-            mapping[emp_id] = {"fullName": full or "Unknown", "team": team or "Unknown"}
-        return mapping
-
-    return {}
-
-
-EMP_MAP = load_employee_map()
-
-def get_employee_info(employee_id: str) -> Dict[str, str]:
-    mapping = load_employee_map()
-    if not isinstance(mapping, dict):
-        return {"fullName": "Unknown", "team": "Unknown"}
-    info = mapping.get(str(employee_id))
-    if not isinstance(info, dict):
-        return {"fullName": "Unknown", "team": "Unknown"}
-    full = info.get("fullName") or info.get("name") or "Unknown"
-    team = info.get("team") or info.get("Department") or info.get("department") or "Unknown"
-    return {"fullName": str(full), "team": str(team)}
-
-
-def process_employee_date(employee_id: str, date: str, force: bool = False) -> Dict:
+ProgressCallback = Callable[[Dict], None]
+
+
+def _emit(progress: Optional[ProgressCallback], event: Dict) -> None:
+    if progress is None:
+        return
+    try:
+        progress(event)
+    except Exception as ex:
+        logger.warning(f"Progress callback failed for {event.get('fileName')}: {ex}")
+
+
+def _record(timings: Dict[str, float], stage: str, started: float) -> None:
+    timings[stage] = time.perf_counter() - started
+    observe_stage(stage, timings[stage])
+
+
+def _prepare_video(v: Dict) -> Dict:
+    # Network + CPU stages: download, probe, extract and dedupe. Runs ahead of analysis.
+    # Stages with stored artifacts for this ETag are skipped; a complete stored transcript
+    # skips the download and extraction altogether.
+    settings = get_settings()
+    fname = v["file_name"]
+    timings: Dict[str, float] = {}
+    artifacts = load_artifacts(v)
+    if artifacts is not None:
+        transcript = artifacts.transcript()
+        duration_sec = artifacts.duration()
+        if transcript is not None and duration_sec is not None:
+            logger.info(f"Reusing stored transcript for {fname} ({len(transcript)} frames)")
+            count(FRAMES, len(transcript), kind="stored")
+            return {
+                "video": v,
+                "scratch_dir": None,
+                "local_path": None,
+                "duration_sec": duration_sec,
+                "duration_hms": hms(duration_sec),
+                "frames": [],
+                "reuse": {},
+                "transcript": transcript,
+                "artifacts": artifacts,
+                "timings": timings,
+            }
+    scratch_dir = create_scratch_dir(settings.scratch_root)
+    frames_dir = os.path.join(scratch_dir, "frames")
+    try:
+        started = time.perf_counter()
+        if settings.s3_stream_frames:
+            local_path = video_source_url(v["key"])
+        else:
+            local_path = download_to_tmp(v["key"], dest_dir=scratch_dir)
+            logger.info(f"Downloaded {fname}")
+        timings["download"] = time.perf_counter() - started
+        duration_sec = artifacts.duration() if artifacts is not None else None
+        if duration_sec is None:
+            started = time.perf_counter()
+            duration_sec = get_video_duration_seconds(local_path)
+            _record(timings, "probe", started)
+            if artifacts is not None:
+                artifacts.save_duration(duration_sec)
+        duration_hms = hms(duration_sec)
+        logger.info(f"Duration {duration_hms}")
+        started = time.perf_counter()
+        if settings.s3_stream_frames:
+            frames = extract_frames_by_seeking(
+                local_path,
+                n=settings.frame_interval_sec,
+                duration=duration_sec,
+                seeks_per_process=settings.s3_stream_seeks_per_process,
+                out_dir=frames_dir,
+            )
+        elif settings.frame_sampling == "adaptive":
+            frames = extract_adaptive_frames(
+                local_path,
+                duration=duration_sec,
+                scene_threshold=settings.frame_scene_threshold,
+                min_interval=settings.frame_min_interval_sec,
+                max_interval=settings.frame_max_interval_sec,
+                budget=settings.frame_budget,
+                keyframes_only=settings.frame_keyframes_only,
+                out_dir=frames_dir,
+            )
+        elif settings.frame_pipe_mode:
+            frames = extract_frames_to_memory(
+                local_path,
+                n=settings.frame_interval_sec,
+                duration=duration_sec,
+                keyframes_only=settings.frame_keyframes_only,
+                max_buffer_bytes=settings.frame_memory_max_bytes,
+                spill_dir=frames_dir,
+            )
+        else:
+            frames = extract_keyframes_every_n_seconds(
+                local_path,
+                n=settings.frame_interval_sec,
+                duration=duration_sec,
+                keyframes_only=settings.frame_keyframes_only,
+                out_dir=frames_dir,
+            )
+        _record(timings, "extract", started)
+        logger.info(f"Extracted {len(frames)} frames for {fname}")
+        count(FRAMES, len(frames), kind="extracted")
+        if settings.frame_preprocess_enabled:
+            started = time.perf_counter()
+            frames, totals = preprocess_frames(
+                frames,
+                max_width=settings.frame_max_width,
+                max_height=settings.frame_max_height,
+                quality=settings.frame_jpeg_quality,
+                crop_top=settings.frame_crop_top_px,
+                crop_bottom=settings.frame_crop_bottom_px,
+                detail_policy=settings.vision_detail,
+                high_min_bytes=settings.vision_detail_high_min_bytes,
+            )
+            _record(timings, "preprocess", started)
+            count(BYTES, totals["bytes"], kind="frames")
+            if totals["frames"]:
+                logger.info(
+                    f"Preprocessed {totals['frames']} frames for {fname}: {totals['originalBytes']} -> {totals['bytes']} bytes, "
+                    f"~{totals['estimatedTokens'] // totals['frames']} image tokens per frame"
+                )
+        started = time.perf_counter()
+        timestamps = [ts for _, ts in frames]
+        stored = artifacts.frames() if artifacts is not None else None
+        if stored is not None and stored[0] == timestamps:
+            reuse = stored[1]
+        else:
+            hashes: Dict[int, int] = {}
+            reuse = dedupe_frames(frames, settings.frame_dedup_max_distance, hashes)
+            if artifacts is not None:
+                artifacts.save_frames(timestamps, hashes, reuse)
+        _record(timings, "dedup", started)
+        logger.info(f"Dedup saved {len(reuse)} of {len(frames)} vision calls for {fname}")
+        count(FRAMES, len(reuse), kind="deduped")
+    except Exception:
+        remove_scratch_dir(scratch_dir)
+        raise
+    return {
+        "video": v,
+        "scratch_dir": scratch_dir,
+        "local_path": local_path,
+        "duration_sec": duration_sec,
+        "duration_hms": duration_hms,
+        "frames": frames,
+        "reuse": reuse,
+        "transcript": None,
+        "artifacts": artifacts,
+        "timings": timings,
+    }
+
+
+def _analyze_item(
+    item: Dict,
+    employee_id: str,
+    emp_info: Dict,
+    date: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    # Event synthesis reruns only when the stored events are missing or stale, and frame
+    # description only for frames without a stored description.
+    fname = item["video"]["file_name"]
+    fullname = emp_info.get("fullName", "Unknown")
+    team = emp_info.get("team", "Unknown")
+    artifacts = item.get("artifacts")
+    events = artifacts.events(fullname, team) if artifacts is not None and item["transcript"] is not None else None
+    if events is not None:
+        logger.info(f"Reusing stored event log for {fname} ({len(events)} events)")
+        return {"events": events}
+    stored_windows = artifacts.window_events(fullname, team) if artifacts is not None else None
+
+    def save_window(key: str, window_events: List[Dict]) -> None:
+        # Same rule as the final events: only windows built from a complete transcript are kept.
+        if artifacts.transcript() is not None:
+            artifacts.save_window_events(key, window_events, fullname, team)
+
+    on_window = save_window if artifacts is not None else None
+    if item["transcript"] is not None:
+        events_doc = events_from_transcript(
+            filename=fname,
+            duration_hms=item["duration_hms"],
+            transcript=item["transcript"],
+            employee_id=employee_id,
+            fullname=fullname,
+            team=team,
+            date=date,
+            on_event=on_event,
+            stored_windows=stored_windows,
+            on_window=on_window,
+        )
+    else:
+        events_doc = analyze_video_frames_to_events(
+            filename=fname,
+            duration_hms=item["duration_hms"],
+            frames=item["frames"],
+            employee_id=employee_id,
+            fullname=fullname,
+            team=team,
+            date=date,
+            reuse=item["reuse"],
+            described=artifacts.descriptions() if artifacts is not None else None,
+            on_described=artifacts.save_descriptions if artifacts is not None else None,
+            on_event=on_event,
+            stored_windows=stored_windows,
+            on_window=on_window,
+        )
+    # Only a complete transcript with a complete, non-empty result is worth keeping; a partial
+    # one (placeholder frames, a cut-off event stream) should be retried next time.
+    events = events_doc.get("events", [])
+    complete = events_doc.get("complete", True)
+    if artifacts is not None and events and complete and artifacts.transcript() is not None:
+        artifacts.save_events(events, fullname, team)
+    return events_doc
+
+
+def _incomplete_reason(events_doc: Dict) -> str:
+    gaps = events_doc.get("gaps") or []
+    where = ", ".join(f"{g['start']}-{g['end']} ({g['reason']})" for g in gaps) or "event stream ended early"
+    return f"incomplete events, kept {len(events_doc.get('events', []))} and will retry: {where}"
+
+
+def _prepare_stage(
+    videos: List[Dict],
+    out_q: "queue.Queue",
+    stop: threading.Event,
+    leases: Optional[LeaseKeeper] = None,
+    force: bool = False,
+) -> None:
+    # Producer side of the pipeline. The queue is bounded, so at most PIPELINE_PREFETCH
+    # prepared videos (plus the one being prepared) sit on temp disk at any time.
+    # Each video is claimed right before it is prepared; one that another worker holds, or
+    # that was finished elsewhere since the listing, is passed on as skipped. Markers are
+    # re-read _RECHECK_CHUNK videos at a time; a file finished between that read and its
+    # claim is simply redone, which the idempotent writes allow.
+    done_elsewhere: Set[str] = set()
+    try:
+        for idx, v in enumerate(videos):
+            if stop.is_set():
+                break
+            fname = v["file_name"]
+            item: Optional[Dict] = None
+            claimed = False
+            try:
+                if leases is not None and not force and idx % _RECHECK_CHUNK == 0:
+                    chunk = [c["file_name"] for c in videos[idx : idx + _RECHECK_CHUNK]]
+                    done_elsewhere = processed_file_names(leases.employee_id, chunk)
+                if fname in done_elsewhere:
+                    item = {"video": v, "skipped": "processed by another worker"}
+                elif leases is not None:
+                    if leases.claim(fname):
+                        claimed = True
+                    else:
+                        item = {"video": v, "skipped": "claimed by another worker"}
+                if item is None:
+                    item = _prepare_video(v)
+            except Exception as e:
+                logger.exception(f"Error preparing {fname}: {e}")
+                item = {"video": v, "error": e}
+                if claimed:
+                    leases.release([fname])
+            if not _put_unless_stopped(out_q, item, stop):
+                if item.get("scratch_dir"):
+                    remove_scratch_dir(item["scratch_dir"])
+                return
+    finally:
+        # Always tell the consumer we are done, even if something above raised unexpectedly.
+        _put_unless_stopped(out_q, _PIPELINE_DONE, stop)
+
+
+def _put_unless_stopped(out_q: "queue.Queue", item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            out_q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _flush_batch(
+    batch: EventLogBatch,
+    pending: Dict[str, Dict],
+    errors: List[str],
+    progress: Optional[ProgressCallback],
+    leases: Optional[LeaseKeeper] = None,
+) -> int:
+    # Persists buffered event logs + processed markers; returns how many videos were saved.
+    # Videos whose claim was taken over meanwhile are dropped: the new holder saves them.
+    if not batch.documents:
+        return 0
+    if leases is not None:
+        owned = leases.confirm(doc["fileName"] for doc in batch.documents)
+        for doc in [d for d in batch.documents if d["fileName"] not in owned]:
+            batch.documents.remove(doc)
+            info = pending.pop(doc["fileName"], {})
+            errors.append(f"{doc['fileName']}: claim lost to another worker; result discarded")
+            _emit(progress, {"stage": "failed", "fileName": doc["fileName"], "error": "claim lost", **info})
+            count(VIDEOS, kind="failed")
+        if not batch.documents:
+            return 0
+    started = time.perf_counter()
+    try:
+        flushed = batch.flush()
+    except Exception as e:
+        logger.exception(f"Error saving event logs: {e}")
+        if leases is not None:
+            leases.release(list(pending))
+        for fname in list(pending):
+            errors.append(f"{fname}: {e}")
+            _emit(progress, {"stage": "failed", "fileName": fname, "error": str(e)})
+        count(VIDEOS, len(pending), kind="failed")
+        pending.clear()
+        return 0
+    elapsed = time.perf_counter() - started
+    logger.info(f"Saved {len(flushed)} event logs and marked them processed in {elapsed:.2f}s")
+    count(VIDEOS, len(flushed), kind="processed")
+    if leases is not None:
+        leases.release(doc["fileName"] for doc in flushed)
+    record_rollups(flushed)
+    for doc in flushed:
+        info = pending.pop(doc["fileName"], {"events": 0, "timings": {}})
+        info["timings"]["save"] = elapsed
+        _emit(progress, {"stage": "done", "fileName": doc["fileName"], **info})
+    return len(flushed)
+
+
+def process_employee_date(
+    employee_id: str,
+    date: str,
+    force: bool = False,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict:
+    # Stage timings and counters recorded anywhere below (including pool threads that use
+    # metrics.bind) are attached to the summary under "metrics".
+    started = time.perf_counter()
+    with job_scope() as scope:
+        summary = _process_employee_date(employee_id, date, force, progress)
+        observe_stage("employee_date", time.perf_counter() - started)
+    summary["metrics"] = scope.snapshot()
+    return summary
+
+
+def _process_employee_date(
+    employee_id: str,
+    date: str,
+    force: bool,
+    progress: Optional[ProgressCallback],
+) -> Dict:
     settings = get_settings()
     videos = list_videos_for_employee_date(employee_id, date)
     logger.info(f"process_employee_date employee={employee_id} date={date} videos={len(videos)} force={force}")
@@ -80,56 +397,222 @@ def process_employee_date(employee_id: str, date: str, force: bool = False) -> D
     errors: List[str] = []
 
     emp_info = get_employee_info(employee_id)
+    _emit(progress, {"stage": "listed", "videoCount": len(videos)})
 
+    ensure_indexes()
+    already_done = set() if force else processed_file_names(employee_id, [v["file_name"] for v in videos])
+    todo: List[Dict] = []
     for v in videos:
         fname = v["file_name"]
-        if not force and is_processed(employee_id, fname):
+        if fname in already_done:
             skipped.append(fname)
             logger.info(f"Skip already processed {fname}")
+            _emit(progress, {"stage": "skipped", "fileName": fname})
+            count(VIDEOS, kind="skipped")
             continue
-        local_path = None
-        try:
-            local_path = download_to_tmp(v["key"])
-            logger.info(f"Downloaded {fname}")
-            duration_sec = get_video_duration_seconds(local_path)
-            duration_hms = hms(duration_sec)
-            logger.info(f"Duration {duration_hms}")
-            frames = extract_keyframes_every_n_seconds(local_path, n=settings.frame_interval_sec)
-            logger.info(f"Extracted {len(frames)} frames for {fname}")
-            events_doc = analyze_video_frames_to_events(
-                filename=fname,
-                duration_hms=duration_hms,
-                frames=frames,
-                employee_id=employee_id,
-                fullname=emp_info.get("fullName", "Unknown"),
-                team=emp_info.get("team", "Unknown"),
-                date=date,
-            )
-            logger.info(f"GPT events generated for {fname}: {len(events_doc.get('events', []))} events")
+        todo.append(v)
+
+    # Download/extract of the next video overlaps with the GPT stage of the current one.
+    prepared_q: "queue.Queue" = queue.Queue(maxsize=max(1, settings.pipeline_prefetch))
+    stop = threading.Event()
+    leases = lease_keeper(employee_id)
+    producer = threading.Thread(
+        target=bind(_prepare_stage),
+        args=(todo, prepared_q, stop, leases, force),
+        name=f"prepare-{employee_id}-{date}",
+        daemon=True,
+    )
+    producer.start()
 
-            save_event_log(
+    batch = EventLogBatch(settings.mongo_write_batch_size, settings.mongo_write_batch_max_wait_sec)
+    pending: Dict[str, Dict] = {}
+    try:
+        while True:
+            try:
+                item = prepared_q.get(timeout=1.0)
+            except queue.Empty:
+                if batch.due():
+                    processed_count += _flush_batch(batch, pending, errors, progress, leases)
+                if producer.is_alive():
+                    continue
+                # The producer died without its sentinel; nothing more will arrive.
+                logger.error(f"Prepare stage for {employee_id} {date} exited unexpectedly")
+                break
+            if item is _PIPELINE_DONE:
+                break
+            fname = item["video"]["file_name"]
+            if "skipped" in item:
+                skipped.append(fname)
+                logger.info(f"Skip {fname}: {item['skipped']}")
+                _emit(progress, {"stage": "skipped", "fileName": fname, "reason": item["skipped"]})
+                count(VIDEOS, kind="skipped")
+                continue
+            if "error" in item:
+                errors.append(f"{fname}: {item['error']}")
+                _emit(progress, {"stage": "failed", "fileName": fname, "error": str(item["error"])})
+                count(VIDEOS, kind="failed")
+                continue
+            if batch.due():
+                # Save what is waiting before the next (long) analysis starts.
+                processed_count += _flush_batch(batch, pending, errors, progress, leases)
+            scratch_dir = item["scratch_dir"]
+            timings = item["timings"]
+            _emit(
+                progress,
                 {
+                    "stage": "prepared",
                     "fileName": fname,
-                    "caseID": f"{employee_id}_{date}",
-                    "employeeID": employee_id,
-                    "fullName": emp_info.get("fullName", "Unknown"),
-                    "team": emp_info.get("team", "Unknown"),
-                    "date": date,
-                    "events": events_doc.get("events", []),
-                }
+                    "frames": len(item["frames"]),
+                    "durationSec": item["duration_sec"],
+                    "timings": dict(timings),
+                },
             )
-            mark_processed(employee_id, fname)
-            logger.info(f"Marked processed {fname}")
-            processed_count += 1
-        except Exception as e:
-            logger.exception(f"Error processing {fname}: {e}")
-            errors.append(f"{fname}: {e}")
-        finally:
-            if local_path:
-                cleanup_temp_artifacts(local_path)
+            document = {
+                "fileName": fname,
+                "caseID": f"{employee_id}_{date}",
+                "employeeID": employee_id,
+                "fullName": emp_info.get("fullName", "Unknown"),
+                "team": emp_info.get("team", "Unknown"),
+                "date": date,
+            }
+            streamed: Optional[StreamedEventLog] = None
+            try:
+                started = time.perf_counter()
+                cache = get_frame_cache()
+                cache_before = cache.stats() if cache is not None else None
+                streamed = StreamedEventLog(document) if settings.events_streaming else None
+                events_doc = _analyze_item(
+                    item, employee_id, emp_info, date, on_event=streamed.append if streamed is not None else None
+                )
+                timings["analyze"] = time.perf_counter() - started
+                logger.info(f"GPT events generated for {fname}: {len(events_doc.get('events', []))} events")
+                if cache is not None:
+                    stats = cache.stats()
+                    logger.info(
+                        f"Frame cache for {fname}: hits={stats['hits'] - cache_before['hits']} "
+                        f"misses={stats['misses'] - cache_before['misses']} entries={stats['entries']}"
+                    )
+
+                if streamed is not None:
+                    if leases is not None and fname not in leases.confirm([fname]):
+                        raise RuntimeError("claim lost to another worker; result discarded")
+                    started = time.perf_counter()
+                    if not events_doc.get("complete", True):
+                        # Keep what arrived, but leave the file unmarked so the next run redoes it.
+                        streamed.finish(events_doc.get("events", []), complete=False)
+                        raise RuntimeError(_incomplete_reason(events_doc))
+                    streamed.finish(events_doc.get("events", []))
+                    if leases is not None:
+                        leases.release([fname])
+                    record_rollups([dict(document, events=events_doc.get("events", []))])
+                    timings["save"] = time.perf_counter() - started
+                    processed_count += 1
+                    count(VIDEOS, kind="processed")
+                    _emit(
+                        progress,
+                        {"stage": "done", "fileName": fname, "events": len(events_doc.get("events", [])), "timings": timings},
+                    )
+                    continue
+                if not events_doc.get("complete", True):
+                    if leases is not None and fname not in leases.confirm([fname]):
+                        raise RuntimeError("claim lost to another worker; result discarded")
+                    save_incomplete_event_log(
+                        dict(document, events=events_doc.get("events", []), gaps=events_doc.get("gaps", []))
+                    )
+                    raise RuntimeError(_incomplete_reason(events_doc))
+                pending[fname] = {"events": len(events_doc.get("events", [])), "timings": timings}
+                if batch.add(dict(document, events=events_doc.get("events", []))):
+                    processed_count += _flush_batch(batch, pending, errors, progress, leases)
+            except Exception as e:
+                logger.exception(f"Error processing {fname}: {e}")
+                if streamed is not None:
+                    # Don't leave a "streaming" log behind for a run that is not coming back.
+                    try:
+                        streamed.abandon()
+                    except Exception as cleanup_error:
+                        logger.warning(f"Could not close streamed event log of {fname}: {cleanup_error}")
+                if leases is not None:
+                    leases.release([fname])
+                errors.append(f"{fname}: {e}")
+                _emit(progress, {"stage": "failed", "fileName": fname, "error": str(e), "timings": dict(timings)})
+                count(VIDEOS, kind="failed")
+            finally:
+                if scratch_dir:
+                    remove_scratch_dir(scratch_dir)
+        processed_count += _flush_batch(batch, pending, errors, progress, leases)
+    finally:
+        stop.set()
+        producer.join()
+        if leases is not None:
+            leases.close()
+        # Anything prepared but not analyzed (only on an unexpected abort) still gets cleaned up.
+        while True:
+            try:
+                item = prepared_q.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, dict) and item.get("scratch_dir"):
+                remove_scratch_dir(item["scratch_dir"])
 
     summary = {"processedCount": processed_count, "skipped": skipped, "errors": errors}
     logger.info(
         f"process_employee_date done employee={employee_id} date={date} processed={processed_count} skipped={len(skipped)} errors={len(errors)}"
     )
     return summary
+
+
+def _init_pool_process(vision_inflight: int, workers: int) -> None:
+    # Each worker process gets its share of the global in-flight vision budget and of the
+    # OpenAI rate limits, since every process runs its own scheduler.
+    set_vision_inflight_limit(vision_inflight)
+    set_process_shares(workers)
+
+
+def _fan_out_executor(workers: int) -> Executor:
+    settings = get_settings()
+    if settings.process_executor == "process":
+        per_process = max(1, -(-settings.vision_max_inflight // workers))
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_pool_process,
+            initargs=(per_process, workers),
+        )
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="employee-date")
+
+
+def process_employee_dates(
+    pairs: List[Tuple[str, str]],
+    force: bool = False,
+    progress_for: Optional[Callable[[str, str], Optional[ProgressCallback]]] = None,
+) -> List[Dict]:
+    # Runs process_employee_date for every (employee, date) pair, PROCESS_MAX_PARALLEL at a time.
+    # Results come back in the order of `pairs`; a pair that blows up is reported as an error.
+    # progress_for(emp, date) must return a picklable callable when PROCESS_EXECUTOR=process.
+    settings = get_settings()
+    workers = max(1, min(settings.process_max_parallel, len(pairs)))
+    logger.info(f"process_employee_dates pairs={len(pairs)} workers={workers} executor={settings.process_executor}")
+    if workers == 1:
+        results = []
+        for emp, dt in pairs:
+            try:
+                progress = progress_for(emp, dt) if progress_for else None
+                results.append(process_employee_date(emp, dt, force, progress))
+            except Exception as e:
+                logger.exception(f"Error processing emp={emp} date={dt}: {e}")
+                results.append({"processedCount": 0, "skipped": [], "errors": [str(e)]})
+        return results
+
+    with _fan_out_executor(workers) as pool:
+        futures = [
+            pool.submit(process_employee_date, emp, dt, force, progress_for(emp, dt) if progress_for else None)
+            for emp, dt in pairs
+        ]
+        results = []
+        for (emp, dt), fut in zip(pairs, futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                logger.exception(f"Error processing emp={emp} date={dt}: {e}")
+                results.append({"processedCount": 0, "skipped": [], "errors": [str(e)]})
+        return results
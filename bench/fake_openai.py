@@ -0,0 +1,201 @@
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+logger = logging.getLogger("bench.fake-openai")
+
+# Answers /v1/chat/completions the way the pipeline expects: plain text for single-frame
+# vision calls, {"frames": [...]} for batched vision calls and an event log for synthesis.
+# Latency is configurable per call kind so the harness can model a slow upstream.
+
+TIMESTAMP_RE = re.compile(r"\[(\d{2}:\d{2}:\d{2})\]")
+SCREENSHOT_RE = re.compile(r"Screenshot at (\d{2}:\d{2}:\d{2})")
+
+
+class FakeOpenAIStats:
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.images = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, images: int) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.images += images
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "images": self.images}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = {}
+            self.images = 0
+
+
+def _text_of(message: Dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _image_count(messages: List[Dict]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            total += sum(1 for part in content if isinstance(part, dict) and part.get("type") == "image_url")
+    return total
+
+
+def _seconds(value: str) -> int:
+    h, m, s = (int(p) for p in value.split(":"))
+    return h * 3600 + m * 60 + s
+
+
+def _hms(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def _events_for(prompt: str) -> Dict:
+    stamps = sorted(set(_seconds(t) for t in TIMESTAMP_RE.findall(prompt)))
+    events = []
+    for idx, start in enumerate(stamps, start=1):
+        end = stamps[idx] if idx < len(stamps) else start + 30
+        events.append(
+            {
+                "StageSequenceID": idx,
+                "StartTime": _hms(start),
+                "EndTime": _hms(end),
+                "DurationMin": f"{(end - start) / 60.0:.2f}",
+                "ActivityName": "Spreadsheet Cleanup" if idx % 2 else "Email Thread",
+                "ActivityDetail": "The employee edited cells in a workbook. They saved the file afterwards.",
+                "ProcessStageGeneric": "Data Handling",
+                "ToolsUsed": ["Excel"],
+                "FileTypeHandled": "Excel",
+                "CategoryType": "Repetitive",
+                "ValueType": "Value-Added",
+                "Frequency": 1,
+                "ReworkFlag": "No",
+                "ExceptionFlag": "No",
+                "IdleTimeFlag": "No",
+                "SwitchCount": 1,
+                "MicroTaskFlag": "No",
+                "ComplianceCheckFlag": "No",
+                "ErrorRiskLevel": "Low",
+                "AIOpportunityLevel": "Medium",
+                "EliminationPotential": "No",
+                "RootCauseTag": "Other/Unknown",
+                "Observation": "The workbook was edited without interruptions. No unusual pattern was observed.",
+                "Confidence": 0.8,
+            }
+        )
+    return {"events": events}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    vision_latency = 0.0
+    events_latency = 0.0
+    stats: FakeOpenAIStats = None
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        messages = body.get("messages", [])
+        system = _text_of(messages[0]) if messages else ""
+        user = _text_of(messages[-1]) if messages else ""
+        images = _image_count(messages)
+
+        if "You output only valid JSON." in system:
+            kind, latency = "events", self.events_latency
+            content = json.dumps(_events_for(user))
+        elif images > 1:
+            kind, latency = "vision_batch", self.vision_latency
+            frames = [{"timestamp": t, "description": f"Excel workbook open at {t}."} for t in SCREENSHOT_RE.findall(user)]
+            content = json.dumps({"frames": frames})
+        else:
+            kind, latency = "vision", self.vision_latency
+            content = "Excel workbook 'Q3 Accruals.xlsx' is open; the user is editing column D."
+        self.stats.record(kind, images)
+
+        prompt_tokens = max(1, len(json.dumps(messages)) // 4 if images == 0 else len(user) // 4 + 765 * images)
+        completion_tokens = max(1, len(content) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if body.get("stream"):
+            self._stream(body, content, usage, latency)
+            return
+        time.sleep(latency)
+        payload = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body: Dict, content: str, usage: Dict, latency: float) -> None:
+        # Server-sent chunks with the latency spread over the reply, like a model generating tokens.
+        pieces = [content[i : i + 64] for i in range(0, len(content), 64)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send(choices: List[Dict], extra: Dict = None) -> None:
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "bench"),
+                "choices": choices,
+            }
+            chunk.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        for piece in pieces:
+            time.sleep(latency / len(pieces))
+            send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send([], {"usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve(
+    stats: FakeOpenAIStats,
+    vision_latency: float = 0.0,
+    events_latency: float = 0.0,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ThreadingHTTPServer:
+    handler = type(
+        "FakeOpenAIHandler",
+        (_Handler,),
+        {"stats": stats, "vision_latency": vision_latency, "events_latency": events_latency},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
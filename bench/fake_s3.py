@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import os
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger("bench.fake-s3")
+
+# Just enough of the S3 REST API (path-style) for boto3 and ffmpeg:
+# ListObjectsV2, HeadObject and GetObject with Range support. Objects live on disk
+# so multi-GB synthetic recordings are not held in memory.
+
+
+class FakeS3Store:
+    def __init__(self):
+        self._objects: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def put_file(self, bucket: str, key: str, path: str) -> None:
+        with self._lock:
+            self._objects[(bucket, key)] = path
+
+    def get(self, bucket: str, key: str):
+        with self._lock:
+            return self._objects.get((bucket, key))
+
+    def list(self, bucket: str, prefix: str):
+        with self._lock:
+            return sorted(k for b, k in self._objects if b == bucket and k.startswith(prefix))
+
+
+def _etag(path: str) -> str:
+    st = os.stat(path)
+    return hashlib.md5(f"{path}:{st.st_size}:{st.st_mtime}".encode()).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    store: FakeS3Store = None  # set by serve()
+    page_size = 1000
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def _split(self):
+        parsed = urlparse(self.path)
+        parts = unquote(parsed.path).lstrip("/").split("/", 1)
+        bucket = parts[0]
+        key = parts[1] if len(parts) > 1 else ""
+        return bucket, key, parse_qs(parsed.query)
+
+    def do_HEAD(self):
+        self._object(head=True)
+
+    def do_GET(self):
+        bucket, key, query = self._split()
+        if not key:
+            self._list(bucket, query)
+            return
+        self._object(head=False)
+
+    def _list(self, bucket: str, query):
+        prefix = query.get("prefix", [""])[0]
+        token = query.get("continuation-token", [""])[0]
+        keys = [k for k in self.store.list(bucket, prefix) if not token or k > token]
+        page, rest = keys[: self.page_size], keys[self.page_size :]
+        items = []
+        for key in page:
+            path = self.store.get(bucket, key)
+            items.append(
+                "<Contents>"
+                f"<Key>{escape(key)}</Key>"
+                f"<Size>{os.path.getsize(path)}</Size>"
+                f"<ETag>&quot;{_etag(path)}&quot;</ETag>"
+                "<StorageClass>STANDARD</StorageClass>"
+                "</Contents>"
+            )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{self.page_size}</MaxKeys>"
+            f"<IsTruncated>{'true' if rest else 'false'}</IsTruncated>"
+            + (f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if rest else "")
+            + "".join(items)
+            + "</ListBucketResult>"
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _object(self, head: bool):
+        bucket, key, _ = self._split()
+        path = self.store.get(bucket, key)
+        if path is None:
+            body = b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code></Error>'
+            self.send_response(404)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(0 if head else len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        rng = self.headers.get("Range")
+        if rng and rng.startswith("bytes="):
+            first, _, last = rng[len("bytes="):].partition("-")
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+            end = min(end, size - 1)
+            status = 206
+        length = max(0, end - start + 1)
+        self.send_response(status)
+        self.send_header("Content-Type", "video/webm")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{_etag(path)}"')
+        self.send_header("Last-Modified", formatdate(os.path.getmtime(path), usegmt=True))
+        self.send_header("Content-Length", str(length))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if head:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(1 << 20, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+
+
+def serve(store: FakeS3Store, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("FakeS3Handler", (_Handler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-s3", daemon=True).start()
+    return server
@@ -0,0 +1,308 @@
+"""Offline end-to-end benchmark for the video analysis pipeline.
+
+Runs process_employee_date (and optionally the HTTP endpoints) against local
+stand-ins for S3, OpenAI and Mongo, across several recording lengths and
+per-day counts, and writes throughput plus per-stage timings to JSON so runs
+from different commits can be compared:
+
+    python -m bench.run_benchmarks --lengths 60,600 --counts 1,10 --out bench_results.json
+    python -m bench.run_benchmarks --baseline bench_results.json --out bench_after.json
+    python -m bench.run_benchmarks --replicas 3 --mongo-uri mongodb://127.0.0.1:27017
+
+--replicas runs several process_employee_date calls on the same employee-day at
+once, like replicas sharing a backlog, and reports any file that ended up with
+more than one event log.
+
+Needs ffmpeg on PATH. Mongo comes from --mongo-uri, or mongomock when it is
+installed; the app's own dependencies must be installed as usual. mongomock 4.x
+cannot run bulk writes under pymongo 4.11 or later, so the in-memory mode needs
+"pymongo<4.11" next to it.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from . import fake_openai, fake_s3, synth
+
+logger = logging.getLogger("bench")
+
+BUCKET = "bench"
+PREFIX = "bench/activitytrackercontainer"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _configure_env(args, s3_url: str, openai_url: str) -> None:
+    # Settings are read at import time, so this must run before any app module is imported.
+    os.environ.update(
+        {
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "AWS_REGION": "us-east-1",
+            "S3_ENDPOINT_URL": s3_url,
+            "S3_BUCKET": BUCKET,
+            "S3_PREFIX": PREFIX,
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": openai_url + "/v1",
+            "MONGODB_URI": args.mongo_uri or "mongodb://127.0.0.1:27017",
+            "MONGODB_DB": args.mongo_db,
+            "FRAME_CACHE_ENABLED": "true" if args.frame_cache else "false",
+            "S3_LIST_CACHE_TTL_SEC": "0",
+        }
+    )
+    if not args.mongo_uri:
+        # mongomock is swapped in for the blocking client only; keep the endpoints on it too.
+        os.environ["ASYNC_CLIENTS_ENABLED"] = "false"
+    if args.events_streaming:
+        os.environ["EVENTS_STREAMING"] = "true"
+    if args.stream:
+        os.environ["S3_STREAM_FRAMES"] = "true"
+        os.environ["S3_STREAM_BASE_URL"] = f"{s3_url}/{BUCKET}"
+
+
+def _use_in_memory_mongo(args) -> str:
+    if args.mongo_uri:
+        return "mongod"
+    try:
+        import mongomock  # type: ignore
+    except ImportError:
+        sys.exit("Pass --mongo-uri or install mongomock for an in-memory Mongo")
+    import pymongo
+    from app import db_utils
+
+    client = mongomock.MongoClient()
+    try:
+        # The app writes through bulk_write; check it works before every video fails on it.
+        client["probe"]["probe"].bulk_write([pymongo.ReplaceOne({"_id": 1}, {"_id": 1}, upsert=True)])
+    except TypeError as ex:
+        sys.exit(
+            f"mongomock {mongomock.__version__} cannot run bulk writes with pymongo {pymongo.version} ({ex}). "
+            'Install "pymongo<4.11" for the in-memory mode, or pass --mongo-uri.'
+        )
+    db_utils._client = client
+    return "mongomock"
+
+
+def _stage_table(metrics: Dict) -> Dict[str, float]:
+    return {stage: entry["seconds"] for stage, entry in sorted(metrics.get("stages", {}).items())}
+
+
+def _duplicate_logs(employee_id: str) -> Dict[str, int]:
+    from app.db_utils import logs_col
+
+    names = Counter(d["fileName"] for d in logs_col().find({"employeeID": employee_id}, {"fileName": 1}))
+    return {name: n for name, n in names.items() if n > 1}
+
+
+def run_case(
+    store, openai_stats, cache_dir: str, length: int, count: int, date: datetime, replicas: int = 1
+) -> Dict:
+    from app.metrics import merge_snapshots
+    from app.worker import process_employee_date
+
+    employee_id = synth.new_employee_id()
+    for name, path in synth.make_employee_day(cache_dir, employee_id, date, count, length):
+        store.put_file(BUCKET, f"{PREFIX}/{employee_id}/{name}", path)
+
+    openai_stats.reset()
+    day = date.strftime("%Y-%m-%d")
+    started = time.perf_counter()
+    if replicas > 1:
+        with ThreadPoolExecutor(max_workers=replicas) as pool:
+            runs = list(pool.map(lambda _: process_employee_date(employee_id, day, force=False), range(replicas)))
+        summary = {
+            "processedCount": sum(r.get("processedCount", 0) for r in runs),
+            "errors": [e for r in runs for e in r.get("errors", [])],
+            "metrics": merge_snapshots([r.get("metrics", {}) for r in runs]),
+        }
+    else:
+        summary = process_employee_date(employee_id, day, force=False)
+    wall = time.perf_counter() - started
+    recorded = length * count
+    return {
+        "mode": "worker" if replicas <= 1 else f"worker-x{replicas}",
+        "lengthSec": length,
+        "videos": count,
+        "wallSec": round(wall, 3),
+        "videosPerMin": round(count * 60.0 / wall, 3) if wall else None,
+        "recordedHoursPerWallHour": round(recorded / wall, 3) if wall else None,
+        "processed": summary.get("processedCount", 0),
+        "errors": summary.get("errors", []),
+        "stageSeconds": _stage_table(summary.get("metrics", {})),
+        "counters": summary.get("metrics", {}).get("counters", {}),
+        "openai": openai_stats.snapshot(),
+        "duplicateLogs": _duplicate_logs(employee_id),
+    }
+
+
+def run_http_case(store, openai_stats, cache_dir: str, base_url: str, length: int, count: int, date: datetime) -> Dict:
+    employee_id = synth.new_employee_id()
+    for name, path in synth.make_employee_day(cache_dir, employee_id, date, count, length):
+        store.put_file(BUCKET, f"{PREFIX}/{employee_id}/{name}", path)
+    day = date.strftime("%Y-%m-%d")
+
+    openai_stats.reset()
+    started = time.perf_counter()
+    with urllib.request.urlopen(f"{base_url}/process/{employee_id}/{day}?wait=true", timeout=3600) as resp:
+        result = json.loads(resp.read())
+    wall = time.perf_counter() - started
+
+    status_started = time.perf_counter()
+    with urllib.request.urlopen(f"{base_url}/status/{employee_id}/{day}", timeout=60) as resp:
+        json.loads(resp.read())
+    status_ms = (time.perf_counter() - status_started) * 1000
+    return {
+        "mode": "http",
+        "lengthSec": length,
+        "videos": count,
+        "wallSec": round(wall, 3),
+        "videosPerMin": round(count * 60.0 / wall, 3) if wall else None,
+        "recordedHoursPerWallHour": round(length * count / wall, 3) if wall else None,
+        "processed": result.get("processedCount", 0),
+        "errors": result.get("errors", []),
+        "statusMs": round(status_ms, 1),
+        "stageSeconds": _stage_table(result.get("metrics", {})),
+        "openai": openai_stats.snapshot(),
+    }
+
+
+def _start_api(port: int):
+    import uvicorn
+
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    def key(case):
+        return (case["mode"], case["lengthSec"], case["videos"])
+
+    base = {key(c): c for c in baseline.get("cases", [])}
+    lines = [f"baseline {baseline.get('commit')} -> current {current.get('commit')}"]
+    for case in current.get("cases", []):
+        old = base.get(key(case))
+        if not old or not old.get("wallSec"):
+            continue
+        delta = (case["wallSec"] - old["wallSec"]) / old["wallSec"] * 100
+        lines.append(
+            f"{case['mode']:>6} {case['lengthSec']:>6}s x{case['videos']:<3} "
+            f"{old['wallSec']:>9.2f}s -> {case['wallSec']:>9.2f}s ({delta:+.1f}%)"
+        )
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", default="60,300", help="recording lengths in seconds, comma separated")
+    parser.add_argument("--counts", default="1,5", help="recordings per employee-day, comma separated")
+    parser.add_argument("--vision-latency", type=float, default=0.5)
+    parser.add_argument("--events-latency", type=float, default=2.0)
+    parser.add_argument("--mongo-uri", default="", help="local mongod; defaults to mongomock")
+    parser.add_argument("--mongo-db", default="video-summarizer-bench")
+    parser.add_argument("--frame-cache", action="store_true", help="keep the on-disk frame cache enabled")
+    parser.add_argument("--stream", action="store_true", help="read recordings over HTTP instead of downloading")
+    parser.add_argument("--events-streaming", action="store_true", help="stream event synthesis and persist per event")
+    parser.add_argument("--http", action="store_true", help="also benchmark the HTTP endpoints")
+    parser.add_argument("--replicas", type=int, default=1, help="concurrent workers per employee-day")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "video-analysis-bench"))
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default="", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
+    store = fake_s3.FakeS3Store()
+    s3_server = fake_s3.serve(store)
+    openai_stats = fake_openai.FakeOpenAIStats()
+    openai_server = fake_openai.serve(openai_stats, args.vision_latency, args.events_latency)
+    _configure_env(
+        args,
+        f"http://127.0.0.1:{s3_server.server_address[1]}",
+        f"http://127.0.0.1:{openai_server.server_address[1]}",
+    )
+    mongo_kind = _use_in_memory_mongo(args)
+
+    date = datetime(2025, 9, 20)
+    lengths = [int(v) for v in args.lengths.split(",") if v.strip()]
+    counts = [int(v) for v in args.counts.split(",") if v.strip()]
+    cases = []
+    for length in lengths:
+        for count in counts:
+            logger.warning(f"worker case length={length}s count={count}")
+            cases.append(run_case(store, openai_stats, args.cache_dir, length, count, date, args.replicas))
+
+    if args.http:
+        port = _free_port()
+        api = _start_api(port)
+        try:
+            for length in lengths:
+                for count in counts:
+                    logger.warning(f"http case length={length}s count={count}")
+                    cases.append(
+                        run_http_case(store, openai_stats, args.cache_dir, f"http://127.0.0.1:{port}", length, count, date)
+                    )
+        finally:
+            api.should_exit = True
+
+    results = {
+        "commit": _git_commit(),
+        "startedAt": datetime.utcnow().isoformat() + "Z",
+        "mongo": mongo_kind,
+        "visionLatency": args.vision_latency,
+        "eventsLatency": args.events_latency,
+        "cases": cases,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for case in cases:
+        print(
+            f"{case['mode']:>6} {case['lengthSec']:>6}s x{case['videos']:<3} wall={case['wallSec']:>9.2f}s "
+            f"videos/min={case['videosPerMin']} recorded-h/h={case['recordedHoursPerWallHour']} "
+            f"errors={len(case['errors'])}"
+            + (f" duplicate-logs={len(case['duplicateLogs'])}" if case.get("duplicateLogs") else "")
+        )
+    if baseline is not None:
+        print("\n".join(compare(results, baseline)))
+
+    s3_server.shutdown()
+    openai_server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import ffmpeg
+
+# Synthetic screen recordings: alternating static and busy segments, so frame dedup,
+# adaptive sampling and the frame cache see something like a real workday.
+
+
+def recording_file_name(employee_id: str, started_at: datetime) -> str:
+    # Matches s3_utils.FILENAME_RE.
+    return f"ScreenRecording_File_{started_at:%Y%m%d_%H%M%S}_vt1-{employee_id}.webm"
+
+
+def new_employee_id() -> str:
+    return str(uuid.uuid4())
+
+
+def make_recording(
+    out_path: str,
+    duration_sec: int,
+    segment_sec: int = 60,
+    size: str = "1280x720",
+    rate: int = 5,
+) -> str:
+    if os.path.exists(out_path):
+        return out_path
+    segments = []
+    remaining = duration_sec
+    idx = 0
+    while remaining > 0:
+        seg = min(segment_sec, remaining)
+        source = "smptebars" if idx % 2 == 0 else "testsrc2"
+        segments.append(ffmpeg.input(f"{source}=size={size}:rate={rate}:duration={seg}", f="lavfi"))
+        remaining -= seg
+        idx += 1
+    video = segments[0] if len(segments) == 1 else ffmpeg.concat(*segments, v=1, a=0)
+    tmp_path = out_path + ".part"
+    (
+        video
+        .output(
+            tmp_path,
+            format="webm",
+            vcodec="libvpx",
+            deadline="realtime",
+            **{"cpu-used": 8, "b:v": "300k", "g": rate * 10},
+            loglevel="error",
+        )
+        .overwrite_output()
+        .run()
+    )
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def make_employee_day(
+    cache_dir: str,
+    employee_id: str,
+    date: datetime,
+    count: int,
+    duration_sec: int,
+) -> List[Tuple[str, str]]:
+    # Returns (file_name, local_path) pairs. Recordings of one length are generated once
+    # and reused under different names, since only the naming has to be unique.
+    os.makedirs(cache_dir, exist_ok=True)
+    source = make_recording(os.path.join(cache_dir, f"synthetic_{duration_sec}s.webm"), duration_sec)
+    started = date.replace(hour=9, minute=0, second=0, microsecond=0)
+    out = []
+    for i in range(count):
+        name = recording_file_name(employee_id, started + timedelta(seconds=i * (duration_sec + 60)))
+        out.append((name, source))
+    return out
@@ -0,0 +1,99 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from app.gpt_processor import EventStreamParser, validate_event
+
+
+def _full_event(**overrides):
+    event = dict(
+        StageSequenceID=1,
+        StartTime="00:00:00",
+        EndTime="00:01:00",
+        DurationMin="1.00",
+        ActivityName="Typing",
+        ActivityDetail="Drafting a reply",
+        ProcessStageGeneric="Execution",
+        ToolsUsed=["Outlook"],
+        FileTypeHandled="Email",
+        CategoryType="Communication",
+        ValueType="Value-Adding",
+        Frequency=1,
+        ReworkFlag="No",
+        ExceptionFlag="No",
+        IdleTimeFlag="No",
+        SwitchCount=0,
+        MicroTaskFlag="No",
+        ComplianceCheckFlag="No",
+        ErrorRiskLevel="Low",
+        AIOpportunityLevel="Medium",
+        EliminationPotential="Low",
+        RootCauseTag="None",
+        Observation="Wrote an email",
+        Confidence=0.9,
+    )
+    event.update(overrides)
+    return event
+
+
+# EventStreamParser
+
+
+def _feed_in_chunks(text, size):
+    parser = EventStreamParser()
+    out = []
+    for i in range(0, len(text), size):
+        out.extend(parser.feed(text[i : i + size]))
+    return parser, out
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_parser_reads_objects_across_chunk_boundaries(size):
+    text = '{"events": [{"a": "x}{\\"]"}, {"b": {"c": [1, 2]}}, {"d": "\\\\"}]}'
+    parser, out = _feed_in_chunks(text, size)
+    assert out == [{"a": 'x}{"]'}, {"b": {"c": [1, 2]}}, {"d": "\\"}]
+    assert parser.done
+
+
+def test_parser_finds_the_array_after_a_long_preamble():
+    text = '{"note": "' + "x" * 200 + '", "events"  :\n [{"a": 1}]}'
+    parser, out = _feed_in_chunks(text, 5)
+    assert out == [{"a": 1}]
+    assert parser.done
+
+
+def test_parser_passes_non_objects_through_and_skips_garbage():
+    parser, out = _feed_in_chunks('{"events": [1, "s", {"a": 1}, oops, null]}', 3)
+    assert out == [1, "s", {"a": 1}, None]
+    assert parser.done
+    assert [validate_event(obj) for obj in out if not isinstance(obj, dict)] == [None, None, None]
+
+
+def test_parser_keeps_closed_objects_of_an_unterminated_array():
+    parser, out = _feed_in_chunks('{"events": [{"a": 1}, {"b": "unfinished', 4)
+    assert out == [{"a": 1}]
+    assert not parser.done
+
+
+def test_parser_ignores_text_after_the_array():
+    parser = EventStreamParser()
+    assert parser.feed('{"events": []}') == []
+    assert parser.done
+    assert parser.feed('{"events": [{"a": 1}]}') == []
+
+
+# validate_event
+
+
+def test_validate_event_accepts_a_numeric_duration():
+    event = validate_event(_full_event(DurationMin=1.5))
+    assert event["DurationMin"] == "1.5"
+    assert event["ToolsUsed"] == ["Outlook"]
+
+
+def test_validate_event_drops_incomplete_events():
+    event = _full_event()
+    del event["ActivityName"]
+    assert validate_event(event) is None
+    assert validate_event(_full_event(SwitchCount="many")) is None
+    assert validate_event(["not", "a", "dict"]) is None
@@ -0,0 +1,108 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from app.gpt_processor import event_windows, merge_window_events
+from app.video_processor import hms
+
+
+def _event(seq, start, end, activity="Typing", tools=("Word",), **extra):
+    return dict(
+        StageSequenceID=seq,
+        StartTime=hms(start),
+        EndTime=hms(end),
+        DurationMin=f"{(end - start) / 60:.2f}",
+        ActivityName=activity,
+        ToolsUsed=list(tools),
+        SwitchCount=0,
+        **extra,
+    )
+
+
+# event_windows
+
+
+def test_windows_own_every_second_exactly_once():
+    windows = event_windows(6000, 2700, 180)
+    assert windows == [(0, 2700, 0, 2610), (2520, 5220, 2610, 5130), (5040, 6000, 5130, 6001)]
+    for (_, _, _, own_end), (_, _, own_start, _) in zip(windows, windows[1:]):
+        assert own_end == own_start
+    for start, end, own_start, own_end in windows:
+        assert start <= own_start and own_end <= end + 1
+
+
+def test_short_recording_is_one_window():
+    assert event_windows(600, 2700, 180) == [(0, 600, 0, 601)]
+
+
+def test_overlap_is_capped_at_half_a_window():
+    windows = event_windows(300, 100, 90)
+    assert [w[:2] for w in windows] == [(0, 100), (50, 150), (100, 200), (150, 250), (200, 300)]
+    assert windows[-1][3] == 301
+
+
+# merge_window_events
+
+FIRST = (0, 100, 0, 90)
+SECOND = (80, 200, 90, 201)
+
+
+def test_overlap_duplicates_are_kept_once_by_the_owning_window():
+    merged = merge_window_events(
+        [
+            (FIRST, [_event(1, 0, 40, "Reading"), _event(2, 85, 88, "Filing")]),
+            (SECOND, [_event(1, 85, 88, "Filing"), _event(2, 120, 150, "Reading")]),
+        ]
+    )
+    assert [(e["ActivityName"], e["StartTime"]) for e in merged] == [
+        ("Reading", "00:00:00"),
+        ("Filing", "00:01:25"),
+        ("Reading", "00:02:00"),
+    ]
+
+
+def test_same_activity_is_stitched_across_the_boundary():
+    first = _event(1, 60, 95, tools=("Word", "Excel"))
+    first["SwitchCount"] = 2
+    second = _event(1, 95, 150, tools=("Excel", "Word"))
+    second["SwitchCount"] = 3
+    merged = merge_window_events([(FIRST, [first]), (SECOND, [second])])
+    assert len(merged) == 1
+    assert merged[0]["StartTime"] == "00:01:00"
+    assert merged[0]["EndTime"] == "00:02:30"
+    assert merged[0]["DurationMin"] == "1.50"
+    assert merged[0]["SwitchCount"] == 5
+    assert first["EndTime"] == "00:01:35"  # inputs are not modified
+
+
+def test_different_activity_trims_the_overlapping_event():
+    merged = merge_window_events(
+        [(FIRST, [_event(1, 60, 100, "Typing")]), (SECOND, [_event(1, 92, 150, "Browsing")])]
+    )
+    assert [(e["StartTime"], e["EndTime"], e["DurationMin"]) for e in merged] == [
+        ("00:01:00", "00:01:32", "0.53"),
+        ("00:01:32", "00:02:30", "0.97"),
+    ]
+
+
+def test_same_activity_within_one_window_is_not_stitched():
+    merged = merge_window_events([(FIRST, [_event(1, 0, 30), _event(2, 30, 60)])])
+    assert len(merged) == 2
+
+
+def test_stage_sequence_ids_are_renumbered_in_time_order():
+    merged = merge_window_events(
+        [
+            (SECOND, [_event(7, 150, 160, "Browsing"), _event(3, 100, 110, "Filing")]),
+            (FIRST, [_event(7, 10, 20, "Reading"), _event(7, 50, 60, "Typing")]),
+        ]
+    )
+    assert [e["StageSequenceID"] for e in merged] == [1, 2, 3, 4]
+    assert [e["ActivityName"] for e in merged] == ["Reading", "Typing", "Filing", "Browsing"]
+
+
+def test_events_without_a_start_time_stay_with_their_window():
+    undated = _event(1, 0, 10, "Unknown")
+    undated["StartTime"] = "soon"
+    merged = merge_window_events([(FIRST, ["not an event"]), (SECOND, [_event(1, 150, 160), undated])])
+    assert [e["ActivityName"] for e in merged] == ["Unknown", "Typing"]
@@ -0,0 +1,63 @@
+import io
+import shutil
+
+import pytest
+
+ffmpeg = pytest.importorskip("ffmpeg")
+Image = pytest.importorskip("PIL.Image")
+ImageStat = pytest.importorskip("PIL.ImageStat")
+
+from app.video_processor import extract_frames_to_memory, extract_keyframes_every_n_seconds
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not on PATH")
+
+DURATION = 120
+INTERVAL = 30
+
+
+@pytest.fixture(scope="module")
+def clock_clip(tmp_path_factory):
+    # Gray frames whose brightness is twice the presentation time in seconds, so a
+    # sampled frame tells which moment of the recording it shows.
+    path = str(tmp_path_factory.mktemp("clip") / "clock.webm")
+    (
+        ffmpeg
+        .input(f"color=c=black:s=64x64:r=5:d={DURATION}", f="lavfi")
+        .filter("format", "gray")
+        .filter("geq", lum="T*2")
+        .output(path, vcodec="libvpx", video_bitrate="1M", loglevel="error")
+        .overwrite_output()
+        .run()
+    )
+    return path
+
+
+def _shown_at(frame) -> float:
+    image = Image.open(io.BytesIO(frame) if isinstance(frame, bytes) else frame).convert("L")
+    return ImageStat.Stat(image).mean[0] / 2.0
+
+
+def _assert_aligned(frames):
+    assert [ts for _, ts in frames] == list(range(0, DURATION, INTERVAL))
+    for frame, ts in frames:
+        assert abs(_shown_at(frame) - ts) <= 1.5, f"frame labelled {ts}s shows {_shown_at(frame):.1f}s"
+
+
+def test_fps_sampling_matches_timestamps(clock_clip, tmp_path):
+    _assert_aligned(
+        extract_keyframes_every_n_seconds(clock_clip, n=INTERVAL, duration=DURATION, out_dir=str(tmp_path))
+    )
+
+
+def test_pipe_sampling_matches_timestamps(clock_clip):
+    frames = extract_frames_to_memory(clock_clip, n=INTERVAL, duration=DURATION)
+    assert all(isinstance(frame, bytes) for frame, _ in frames)
+    _assert_aligned(frames)
+
+
+def test_pipe_sampling_spills_past_memory_budget(clock_clip, tmp_path):
+    frames = extract_frames_to_memory(
+        clock_clip, n=INTERVAL, duration=DURATION, max_buffer_bytes=1, spill_dir=str(tmp_path)
+    )
+    assert all(isinstance(frame, str) for frame, _ in frames)
+    _assert_aligned(frames)